@@ -0,0 +1,367 @@
+"""
+Benchmarks of encoding and decoding of Knowledge data.
+
+Run ``python Bench.py --output results.json`` (from Mind directory) and
+compare results of two versions to see regressions. ``--map 20000`` also
+compares indexes of :py:class:`Orientation.MAP` (needs pygame).
+"""
+
+if __name__ == '__main__':
+    import Knowledge
+else:
+    from . import Knowledge
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+
+def small_ints(count):
+    """Returns list of ints from 0 to 127.
+    """
+    return [random.randrange(128) for x in range(count)]
+
+
+def medium_ints(count):
+    """Returns list of ints up to about million (also negative).
+    """
+    return [random.randrange(-2 ** 20, 2 ** 20) for x in range(count)]
+
+
+def big_ints(count):
+    """Returns list of ints up to 2 ** 62 (also negative).
+    """
+    return [random.randrange(-2 ** 62, 2 ** 62) for x in range(count)]
+
+
+def floats(count):
+    """Returns list of floats.
+    """
+    return [random.uniform(-1e6, 1e6) for x in range(count)]
+
+
+def long_strings(count):
+    """Returns list of strings of few KiB.
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyz '
+    return [''.join(random.choice(letters) for x in range(4096)) for y in
+      range(max(count // 1000, 1))]
+
+
+def wide_dicts(count):
+    """Returns list of dicts with thousand keys.
+    """
+    return [{'key' + str(x): x for x in range(1000)} for y in
+      range(max(count // 1000, 1))]
+
+
+def deep_lists(count):
+    """Returns list of lists nested 100 times.
+    """
+    values = []
+    for y in range(max(count // 100, 1)):
+        value = [y]
+        for x in range(100):
+            value = [x, value]
+        values.append(value)
+    return values
+
+
+def save_game(count):
+    """Returns list of records like in saved game (entities with position,\
+    health, name, inventory and flags).
+    """
+    items = ['sword', 'shield', 'potion', 'arrow', 'gold']
+    return [{'name': 'entity' + str(x), 'position': [random.randrange(4096),
+      random.randrange(4096)], 'hp': random.randrange(100), 'speed':
+      random.random() * 5, 'inventory': random.sample(items, 3), 'alive':
+      random.random() > 0.1, 'quest': None} for x in range(count // 10)]
+
+
+CASES = [small_ints, medium_ints, big_ints, floats, long_strings,
+  wide_dicts, deep_lists, save_game]
+"""Functions which return data of benchmark cases.
+"""
+LEGACY_CASES = [small_ints, long_strings, deep_lists]
+"""Cases which format version 1 can save (it has no dicts and negative\
+numbers and saves numbers in unary code of 250s).
+"""
+
+FORMATS = {
+    'v1': (Knowledge.data_bytes, Knowledge.bytes_data),
+    'v2': (Knowledge.data_bytes_v2, Knowledge.bytes_data_v2),
+}
+"""Encoding and decoding function of format versions.
+"""
+
+
+def encode(values, data_bytes):
+    """Returns values encoded one by one (like records of file).
+    """
+    final = bytearray()
+    for value in values:
+        final += data_bytes(value)
+    return final
+
+
+def decode(binary, bytes_data):
+    """Returns list of values decoded from binary.
+    """
+    return list(bytes_data(binary))
+
+
+def timed(function, *args, repeat=3):
+    """Returns the best time of function call in seconds.
+    """
+    best = float('inf')
+    for x in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        function(*args)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def allocated(function, *args):
+    """Returns the biggest size of memory allocated by function call in\
+    bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def peak_rss():
+    """Returns the biggest memory use of process in bytes (``None`` if it\
+    can't be found).
+
+    It only grows during run, so it's measured once for all cases (memory
+    of one case is measured by ``allocated``).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_case(case, version, count, repeat=3):
+    """Returns dict of results of one case in one format version.
+
+    Case is ``unsupported`` if format can't save its data unchanged.
+    """
+    if version == 'v1' and case not in LEGACY_CASES:
+        return {'case': case.__name__, 'version': version, 'unsupported': True}
+    random.seed(case.__name__)
+    values = case(count)
+    data_bytes, bytes_data = FORMATS[version]
+    result = {'case': case.__name__, 'version': version}
+    try:
+        binary = encode(values, data_bytes)
+        supported = decode(binary, bytes_data) == values
+    except Exception:
+        supported = False
+    if not supported:
+        result['unsupported'] = True
+        return result
+    megabytes = len(binary) / 1e6
+    encoding = timed(encode, values, data_bytes, repeat=repeat)
+    decoding = timed(decode, binary, bytes_data, repeat=repeat)
+    result.update({
+        'bytes': len(binary),
+        'encode_s': encoding,
+        'decode_s': decoding,
+        'encode_mb_s': megabytes / encoding,
+        'decode_mb_s': megabytes / decoding,
+        'encode_alloc_peak': allocated(encode, values, data_bytes),
+        'decode_alloc_peak': allocated(decode, binary, bytes_data),
+    })
+    return result
+
+
+def run(count=100000, repeat=3, versions=('v1', 'v2'), cases=None):
+    """Runs benchmark cases and returns results with information about\
+    environment.
+
+    :param int count: number of values of cases (number of big values is\
+    smaller)
+    :param int repeat: number of runs of every measurement (the best is\
+    used)
+    :param versions: format versions to measure
+    :param cases: names of cases (all if ``None``)
+    :rtype: dict
+    """
+    results = []
+    for case in CASES:
+        if cases and case.__name__ not in cases:
+            continue
+        for version in versions:
+            results.append(run_case(case, version, count, repeat))
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'format_version': Knowledge.VERSION,
+        'count': count,
+        'repeat': repeat,
+        'results': results,
+        'peak_rss': peak_rss(),
+    }
+
+
+def _orientation():
+    """Returns Orientation module (imported only for map benchmarks, because\
+    it needs pygame).*
+    """
+    if __name__ == '__main__':
+        import Orientation
+    else:
+        from . import Orientation
+    return Orientation
+
+
+def _fill_map(Orientation, index, size, boxes):
+    """Returns map with given index and rects with given boxes.*
+    """
+    Map = Orientation.MAP(size, size, index=index)
+    for box in boxes:
+        Orientation.rect(*box, Map=Map)
+    return Map
+
+
+def _move_rects(Map, steps):
+    """Moves every rect of map by one of steps.*
+    """
+    for obj, (x, y) in zip(Map.objects, steps):
+        obj.x += x
+        obj.y += y
+        Map.update(obj)
+
+
+def _find_at(Map, points):
+    """Finds objects at every point.*
+    """
+    for x, y in points:
+        for obj in Map.at(x, y):
+            pass
+
+
+def _find_in(Map, rects):
+    """Finds objects in every rect.*
+    """
+    for rect in rects:
+        Map.query_rect(*rect)
+
+
+def run_map(count=20000, repeat=3, indexes=('grid', 'tree')):
+    """Returns list of dicts of results of map indexes.
+
+    Rects of different sizes (mostly small, few big) are added to map, moved
+    a bit (like every frame of game) and far (teleports) and found at points
+    and in rects of screen size.
+
+    :param int count: number of rects
+    :param int repeat: number of runs of every measurement (the best is\
+    used)
+    :param indexes: names of indexes
+    :rtype: list
+    """
+    Orientation = _orientation()
+    random.seed('map')
+    size = int((count * 4096) ** 0.5)
+    boxes = []
+    for x in range(count):
+        side = random.choice((8, 16, 16, 32, 32, 64, 512))
+        boxes.append((random.randrange(size), random.randrange(size), side,
+          side))
+    small = [(random.randint(-4, 4), random.randint(-4, 4)) for x in
+      range(count)]
+    far = [(random.randint(-size // 4, size // 4), random.randint(-size //
+      4, size // 4)) for x in range(count)]
+    points = [(random.randrange(size), random.randrange(size)) for x in
+      range(count)]
+    rects = [(random.randrange(size), random.randrange(size), 640, 480) for
+      x in range(count // 100 + 1)]
+    results = []
+    for index in indexes:
+        Map = _fill_map(Orientation, index, size, boxes)
+        results.append({
+            'index': index,
+            'count': count,
+            'add_s': timed(_fill_map, Orientation, index, size, boxes,
+              repeat=repeat),
+            'small_moves_s': timed(_move_rects, Map, small, repeat=repeat),
+            'far_moves_s': timed(_move_rects, Map, far, repeat=repeat),
+            'at_s': timed(_find_at, Map, points, repeat=repeat),
+            'query_rect_s': timed(_find_in, Map, rects, repeat=repeat),
+        })
+    return results
+
+
+def report(results):
+    """Prints table of results.
+    """
+    print('%-14s %-3s %10s %10s %10s %12s' % ('case', 'ver', 'bytes',
+      'enc MB/s', 'dec MB/s', 'alloc peak'))
+    for result in results['results']:
+        if result.get('unsupported'):
+            print('%-14s %-3s %10s' % (result['case'], result['version'],
+              'unsupported'))
+            continue
+        print('%-14s %-3s %10d %10.2f %10.2f %12d' % (result['case'],
+          result['version'], result['bytes'], result['encode_mb_s'],
+          result['decode_mb_s'], max(result['encode_alloc_peak'],
+          result['decode_alloc_peak'])))
+    if results.get('map'):
+        print()
+        print('%-6s %8s %10s %10s %10s %10s %10s' % ('index', 'count',
+          'add s', 'small s', 'far s', 'at s', 'rect s'))
+        for result in results['map']:
+            print('%-6s %8d %10.3f %10.3f %10.3f %10.3f %10.3f' % (
+              result['index'], result['count'], result['add_s'],
+              result['small_moves_s'], result['far_moves_s'],
+              result['at_s'], result['query_rect_s']))
+    rss = results['peak_rss']
+    if rss is not None:
+        print('peak RSS: %.1f MB' % (rss / 1e6))
+
+
+def main(argv=None):
+    """Runs benchmarks from command line.
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks of Knowledge'
+      ' encoding and decoding.')
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--version', action='append', choices=FORMATS)
+    parser.add_argument('--case', action='append', choices=[case.__name__
+      for case in CASES])
+    parser.add_argument('--map', type=int, metavar='COUNT', help='also'
+      ' compare map indexes with COUNT objects')
+    parser.add_argument('--output', help='file for results in JSON')
+    args = parser.parse_args(argv)
+    results = run(args.count, args.repeat, args.version or tuple(FORMATS),
+      args.case)
+    if args.map:
+        results['map'] = run_map(args.map, args.repeat)
+        results['peak_rss'] = peak_rss()
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,378 @@
 Part of library for data saving.
 """
 
+import argparse
+import array
+import copyreg
+import hashlib
+import io
+import keyword
+import mmap
+import os
+import pickle
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from importlib import import_module
+from itertools import chain, repeat
+from operator import attrgetter
+from threading import Lock
+from time import perf_counter, sleep
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'KNW'
+"""Bytes every Knowledge file in format version 2 (or newer) starts with.
+"""
+VERSION = 2
+"""Format version used by default when saving.
+"""
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _LIST, _DICT, _TOMBSTONE, _ARRAY,\
+  _BYTES, _REF, _TABLE = range(13)
+_DOUBLE = struct.Struct('<d')
+_OFFSET = struct.Struct('<Q')
+
+_INDEXED = 1
+_COMPRESSED = 2
+_INTERNED = 4
+_SEGMENTED = 8
+_CHECKED = 16
+_JOURNAL = 32
+
+_CODECS = ('zlib', 'lzma', 'bz2')
+_BLOCK = struct.Struct('<II')
+_CHECKED_BLOCK = struct.Struct('<III')
+_BLOCK_SIZE = 65536
+_CACHED_BLOCKS = 8
+_SEGMENTS_PER_WORKER = 4
+
+
+_PACKED_LIST, _PACKED_ARRAY, _PACKED_NDARRAY = range(3)
+_PACK_MIN = 16
+_INT_CODES = (('b', 1 << 7), ('h', 1 << 15), ('i', 1 << 31), ('q', 1 << 63))
+_SIZES = {'b': 1, 'B': 1, 'h': 2, 'H': 2, 'i': 4, 'I': 4, 'q': 8, 'Q': 8,
+  'f': 4, 'd': 8}
+_INTERN_STR = 256
+_INTERN_LIST = 16
+_INTERNED_ITEMS = {str, int, bool, type(None)}
+_SIGNED = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+_RECORDS, _RECORD = range(2)
+_UNSIGNED = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+class KnowledgeError(Exception):
+    """Exception for damaged or unknown Knowledge files.*
+    """
+    pass
+
+
+class _Deleted:
+    """Class of :py:data:`DELETED`.*
+    """
+    def __repr__(self):
+        return 'DELETED'
+
+
+DELETED = _Deleted()
+"""Value of deleted keys in journal files (see :py:func:`iter_load`).
+"""
+
+
+
+def _track(value, owner):
+    """Returns value with lists and dicts replaced by tracked ones which\
+    call owner when they are changed.*
+    """
+    kind = type(value)
+    if kind is list or kind is TrackedList and value._owner is not owner:
+        return TrackedList(value, owner)
+    elif kind is dict or kind is TrackedDict and value._owner is not owner:
+        return TrackedDict(value, owner)
+    return value
+
+
+_IMMUTABLE = {str, int, float, bool, bytes, type(None)}
+
+
+def _frozen(value, hidden=False):
+    """Returns ``True`` if value has only immutable and tracked values, so\
+    it can't be changed without telling its owner.*
+
+    Saved form of other values (arrays, bytearrays, records, lists in
+    tuples...) can't be reused, because their changes aren't noticed. If
+    hidden is ``True``, value was never given out by its owner (e.g. it was
+    loaded), so its normal lists and dicts can't be changed too.
+    """
+    kind = type(value)
+    if kind in _IMMUTABLE:
+        return True
+    elif kind is tuple or kind is TrackedList:
+        # lists in tuples aren't tracked even after value is given out
+        return all(map(_frozen, value))
+    elif kind is TrackedDict:
+        return all(map(_frozen, value.values()))
+    elif hidden and kind is list:
+        return all(_frozen(x, True) for x in value)
+    elif hidden and kind is dict:
+        return all(_frozen(x, True) for x in value.values())
+    elif kind is memoryview:
+        return value.readonly
+    return False
+
+
+class TrackedList(list):
+    """List which tells :py:class:`Knowledge` that it was changed (see\
+    track argument of :py:class:`Knowledge`).
+
+    Lists and dicts put into it are tracked too. It's saved and pickled as
+    normal list.
+    """
+    __slots__ = ('_owner',)
+
+    def __init__(self, values=(), owner=None):
+        list.__init__(self, [_track(value, owner) for value in values])
+        self._owner = owner
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def _changed(self):
+        """Calls owner.*
+        """
+        if self._owner is not None:
+            self._owner()
+
+    def __setitem__(self, index, value):
+        self._changed()
+        if type(index) is slice:
+            value = [_track(x, self._owner) for x in value]
+        else:
+            value = _track(value, self._owner)
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self._changed()
+        list.__delitem__(self, index)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, number):
+        self._changed()
+        return list.__imul__(self, number)
+
+    def append(self, value):
+        self._changed()
+        list.append(self, _track(value, self._owner))
+
+    def extend(self, values):
+        self._changed()
+        list.extend(self, [_track(value, self._owner) for value in values])
+
+    def insert(self, index, value):
+        self._changed()
+        list.insert(self, index, _track(value, self._owner))
+
+    def pop(self, *index):
+        self._changed()
+        return list.pop(self, *index)
+
+    def remove(self, value):
+        self._changed()
+        list.remove(self, value)
+
+    def clear(self):
+        self._changed()
+        list.clear(self)
+
+    def sort(self, *args, **kwargs):
+        self._changed()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._changed()
+        list.reverse(self)
+
+
+class TrackedDict(dict):
+    """Dict which tells :py:class:`Knowledge` that it was changed (see\
+    track argument of :py:class:`Knowledge`).
+
+    Lists and dicts put into it are tracked too. It's saved and pickled as
+    normal dict.
+    """
+    __slots__ = ('_owner',)
+
+    def __init__(self, values=(), owner=None):
+        dict.__init__(self, values)
+        for key in self:
+            dict.__setitem__(self, key, _track(self[key], owner))
+        self._owner = owner
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def _changed(self):
+        """Calls owner.*
+        """
+        if self._owner is not None:
+            self._owner()
+
+    def __setitem__(self, key, value):
+        self._changed()
+        dict.__setitem__(self, key, _track(value, self._owner))
+
+    def __delitem__(self, key):
+        self._changed()
+        dict.__delitem__(self, key)
+
+    def __ior__(self, values):
+        self.update(values)
+        return self
+
+    def pop(self, *args):
+        self._changed()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._changed()
+        return dict.popitem(self)
+
+    def clear(self):
+        self._changed()
+        dict.clear(self)
+
+    def update(self, *args, **kwargs):
+        self._changed()
+        for key, value in dict(*args, **kwargs).items():
+            dict.__setitem__(self, key, _track(value, self._owner))
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+_SCHEMAS = {}
+_FOUND_SCHEMAS = {}
+
+
+class Schema:
+    """Description of records with fixed fields of numbers.
+
+    Lists of records of schema are saved as one block of columns of packed
+    numbers, which is much smaller and faster to load than list of lists.
+    Records are instances of :py:attr:`record` class (with ``__slots__``).
+
+    :param str name: name of schema (saved in file, so it has to be unique)
+    :param fields: list of (field name, struct code) pairs; codes are 'b',\
+    'B', 'h', 'H', 'i', 'I', 'q', 'Q' (integers), 'f', 'd' (floats) and '?'\
+    (bool)
+    :param bool ndarray: if ``True`` and numpy is installed, lists of\
+    records are loaded as numpy structured arrays
+    :param bool register: if ``True`` schema is used for loading of records\
+    with its name
+    """
+    def __init__(self, name, fields, ndarray=False, register=True):
+        self.name = name
+        self.fields = [(field, code) for field, code in fields]
+        self.ndarray = ndarray
+        for field, code in self.fields:
+            if code not in _SIZES and code != '?':
+                raise ValueError("Unknown struct code " + repr(code))
+            if not field.isidentifier() or keyword.iskeyword(field) or\
+              field.startswith('_'):
+                raise ValueError("Wrong field name " + repr(field))
+        self.names = [field for field, code in self.fields]
+        self.record = _record_class(self)
+        self.dtype = None
+        if numpy is not None:
+            self.dtype = numpy.dtype([(field, '<' + code) for field, code in
+              self.fields])
+        if register:
+            _SCHEMAS[name] = self
+
+    def __repr__(self):
+        return 'Schema(' + repr(self.name) + ', ' + repr(self.fields) + ')'
+
+    def __call__(self, *values):
+        return self.record(*values)
+
+
+def _record_class(schema):
+    """Returns class of records of schema.*
+    """
+    names = schema.names
+    namespace = {}
+    # like collections.namedtuple, __init__ is generated, because it's much
+    # faster than setting attributes in loop
+    exec('def __init__(self, ' + ', '.join(names) + '):\n' + ''.join(
+      '    self.' + name + ' = ' + name + '\n' for name in names) +
+      '    pass\n', namespace)
+    return type(schema.name if schema.name.isidentifier() else 'Record',
+      (_Record,), {'__slots__': tuple(names), '__init__':
+      namespace['__init__'], '_schema': schema})
+
+
+class _Record:
+    """Base class of records of :py:class:`Schema`.*
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return self._schema.name + '(' + ', '.join(name + '=' + repr(
+          getattr(self, name)) for name in self.__slots__) + ')'
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) ==
+          getattr(other, name) for name in self.__slots__)
+
+    def __iter__(self):
+        for name in self.__slots__:
+            yield getattr(self, name)
+
+    def __reduce__(self):
+        return _load_record, (self._schema.name, self._schema.fields,
+          tuple(self))
+
+    __hash__ = None
+
+
+def _load_record(name, fields, values):
+    """Returns record of schema name with fields (used by pickle); schema\
+    doesn't have to be registered.*
+    """
+    return _find_schema(name, [tuple(field) for field in fields]).record(
+      *values)
+
+
+def _find_schema(name, fields):
+    """Returns schema of records loaded from file.*
+
+    Registered schema is used if it has the same fields, otherwise new
+    schema is made (once for every name and fields).
+    """
+    schema = _SCHEMAS.get(name)
+    if schema is not None and schema.fields == fields:
+        return schema
+    key = (name, tuple(fields))
+    if key not in _FOUND_SCHEMAS:
+        _FOUND_SCHEMAS[key] = Schema(name, fields, register=False)
+    return _FOUND_SCHEMAS[key]
+
 
 def data_bytes(data):
     """
@@ -42,122 +414,2761 @@ def data_bytes(data):
     return final
 
 
-class Knowledge:
-    """Class for all data in program.
+def _varint(number, out):
+    """Appends unsigned number to out as varint (7 bits per byte).*
+    """
+    while number > 0x7f:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
 
-    :param str filename: name of data file without extension
-    :param str ext: extension of data file
+
+def _read_varint(binary, pos):
+    """Reads varint at pos, returns number and position after it.*
     """
-    def __init__(self, filename, ext='.knw'):
-        self.data = {}
-        self.filename = filename + ext
-        self.save = bytearray()
+    byte = binary[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+    number = byte & 0x7f
+    shift = 7
+    while True:
+        byte = binary[pos]
+        pos += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
 
-    def __repr__(self):
-        self.ret = ''
-        for x in self.data:
-            self.ret += str(x)
-            self.ret += ' : '
-            self.ret += str(self.data[x])
-            self.ret += '\n'
-        return self.ret[:-1]  # so last \n is deleted
 
-    def __getitem__(self, key):
-        return self.data[key]
+def _pack(data, out, refs=None):
+    """Appends data in format version 2 to bytearray out; strings and lists\
+    which are in dict refs are replaced by their number.*
+    """
+    kind = type(data)
+    if kind is str:
+        if refs is not None and data in refs:
+            out.append(_REF)
+            _varint(refs[data], out)
+            return
+        raw = data.encode('utf-8', 'surrogatepass')
+        out.append(_STR)
+        _varint(len(raw), out)
+        out += raw
+    elif kind is int:
+        out.append(_INT)
+        _varint(data << 1 if data >= 0 else (-data << 1) - 1, out)
+    elif kind is float:
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(data)
+    elif kind is list or kind is tuple or kind is TrackedList:
+        if data and isinstance(getattr(type(data[0]), '_schema', None),
+              Schema):
+            if all(type(x) is type(data[0]) for x in data):
+                _pack_table(type(data[0])._schema, _RECORDS, data, out)
+                return
+        code = _list_code(data) if len(data) >= _PACK_MIN else None
+        if code:
+            _pack_array(_PACKED_LIST, code, array.array(code, data), out)
+            return
+        if refs is not None and len(data) <= _INTERN_LIST:
+            key = _list_key(data)
+            if key in refs:
+                out.append(_REF)
+                _varint(refs[key], out)
+                return
+        out.append(_LIST)
+        _varint(len(data), out)
+        for x in data:
+            _pack(x, out, refs)
+    elif kind is dict or kind is TrackedDict:
+        out.append(_DICT)
+        _varint(len(data), out)
+        for key in data:
+            _pack(key, out, refs)
+            _pack(data[key], out, refs)
+    elif data is None:
+        out.append(_NONE)
+    elif kind is bool:
+        out.append(_TRUE if data else _FALSE)
+    elif kind is bytes or kind is bytearray or kind is memoryview:
+        view = memoryview(data)
+        out.append(_BYTES)
+        _varint(view.nbytes, out)
+        out += view if view.c_contiguous else view.tobytes()
+    elif kind is array.array:
+        _pack_array(_PACKED_ARRAY, _array_code(data.typecode, data.itemsize,
+          data), data, out)
+    elif isinstance(data, _Record):
+        _pack_table(data._schema, _RECORD, (data,), out)
+    elif numpy is not None and isinstance(data, numpy.ndarray):
+        if data.dtype.names is not None:
+            _pack_table(_dtype_schema(data), _RECORDS, data, out)
+            return
+        code = _array_code(data.dtype.char, data.itemsize, data)
+        _pack_array(_PACKED_NDARRAY, code, numpy.ascontiguousarray(data,
+          data.dtype.newbyteorder('<')), out, data.shape)
+    else:
+        raise TypeError("Knowledge can't save " + repr(data))
 
-    def __setitem__(self, key, value):
-        self.data[key] = value
 
-    def save_data(self):
-        """Saves all data.
-        """
-        for thing in self.data:
-            for bit in data_bytes(thing):
-                self.save.append(bit)
-            for bit in data_bytes(self.data[thing]):
-                self.save.append(bit)
-        with open(self.filename, 'wb') as output:
-            output.write(self.save)
+def _list_key(data):
+    """Returns key of flat list used in table of repeated values or\
+    ``None`` if list can't be interned.*
+
+    Only lists of strings, ints, bools and None are interned, because their
+    equal items are saved the same (equal floats like 0.0 and -0.0 and
+    nested lists like [1] and [1.0] aren't). Types are part of key, so
+    lists like [1] and [True] are different.
+    """
+    types = tuple(map(type, data))
+    if not _INTERNED_ITEMS.issuperset(types):
+        return None
+    return (tuple(data), types)
 
 
-def bytes_data(binary):
-    """Function that bytes converts to data(numbers, strings...).*
+def _count(data, counts):
+    """Counts strings and small lists in data.*
     """
-    thing = None
-    decimal = False
-    ret = None
-    nested = 0
-    for x in binary:
-        if thing == 'integer':
-            if x == 0:
-                thing = None
-                decimal = False
-                yield ret
-                ret = None
-            elif x == 2:
-                decimal = True
-            else:
-                if decimal:
-                    ret += x / 1000 + 0.005
-                else:
-                    ret += x - 5
-        elif thing == 'string':
-            if x == 1:
-                thing = None
-                yield ret
-                ret = None
-            else:
-                ret += chr(x)
-        elif thing == 'list':
-            if x == 3:
-                nested += 1
-            if x == 4:
-                if nested:
-                    nested -= 1
-                    ret.append(x)
-                else:
-                    thing = None
-                    fin = []
-                    for b in bytes_data(ret):
-                        fin.append(b)
-                    yield fin
-                    ret = None
+    kind = type(data)
+    if kind is str:
+        if len(data) <= _INTERN_STR:
+            counts[data] = counts.get(data, 0) + 1
+    elif kind is list or kind is tuple or kind is TrackedList:
+        if len(data) <= _INTERN_LIST:
+            key = _list_key(data)
+            if key is not None:
+                counts[key] = counts.get(key, 0) + 1
+        for x in data:
+            _count(x, counts)
+    elif kind is dict or kind is TrackedDict:
+        for key in data:
+            _count(key, counts)
+            _count(data[key], counts)
+
+
+def _list_code(data):
+    """Returns array typecode for list of only ints or only floats.*
+    """
+    kinds = set(map(type, data))
+    if len(kinds) != 1:
+        return None
+    elif int in kinds:
+        low = min(data)
+        high = max(data)
+        for code, limit in _INT_CODES:
+            if -limit <= low and high < limit:
+                return code
+    elif float in kinds:
+        return 'd'
+    return None
+
+
+def _array_code(code, size, data):
+    """Returns typecode with given size used in file for array typecode\
+    (or numpy dtype char).*
+    """
+    if code in 'fd' and size in (4, 8):
+        return 'f' if size == 4 else 'd'
+    elif code in 'bhilq' and size in _SIGNED:
+        return _SIGNED[size]
+    elif code in 'BHILQ' and size in _UNSIGNED:
+        return _UNSIGNED[size]
+    raise TypeError("Knowledge can't save " + repr(data))
+
+
+def _pack_array(kind, code, data, out, shape=()):
+    """Appends array data as one block of little-endian numbers to out.*
+    """
+    out.append(_ARRAY)
+    out.append(kind)
+    out.append(ord(code))
+    if kind == _PACKED_NDARRAY:
+        _varint(len(shape), out)
+        for size in shape:
+            _varint(size, out)
+    _varint(len(data) if kind != _PACKED_NDARRAY else data.size, out)
+    if sys.byteorder == 'big' and kind != _PACKED_NDARRAY:
+        data = array.array(data.typecode, data)
+        data.byteswap()
+    out += memoryview(data)
+
+
+def _unpack_array(binary, pos):
+    """Reads block of numbers at pos, returns list, array or numpy array\
+    and position after it.*
+
+    numpy arrays share memory with binary; if numpy isn't installed they are
+    loaded as flat arrays.
+    """
+    kind = binary[pos]
+    code = chr(binary[pos + 1])
+    pos += 2
+    shape = []
+    if kind == _PACKED_NDARRAY:
+        dims, pos = _read_varint(binary, pos)
+        for x in range(dims):
+            size, pos = _read_varint(binary, pos)
+            shape.append(size)
+    count, pos = _read_varint(binary, pos)
+    end = pos + count * _SIZES[code]
+    if end > len(binary):
+        raise IndexError('array outside of data')
+    if kind == _PACKED_NDARRAY and numpy is not None:
+        return numpy.frombuffer(binary, '<' + code, count, pos).reshape(
+          shape), end
+    fin = array.array(code)
+    fin.frombytes(memoryview(binary)[pos:end])
+    if sys.byteorder == 'big':
+        fin.byteswap()
+    if kind == _PACKED_LIST:
+        return fin.tolist(), end
+    return fin, end
+
+
+def _dtype_schema(data):
+    """Returns registered schema with fields of numpy structured array data.*
+    """
+    for schema in _SCHEMAS.values():
+        if data.ndim == 1 and schema.names == list(data.dtype.names) and all(
+              data.dtype[field].kind == schema.dtype[field].kind and
+              data.dtype[field].itemsize == schema.dtype[field].itemsize for
+              field in schema.names):
+            return schema
+    raise TypeError("Knowledge can't save " + repr(data) + " (no schema)")
+
+
+def _pack_table(schema, kind, data, out):
+    """Appends records (list, tuple or numpy structured array) of schema to\
+    out as columns of numbers.*
+    """
+    out.append(_TABLE)
+    out.append(kind)
+    _pack(schema.name, out)
+    _varint(len(schema.fields), out)
+    for field, code in schema.fields:
+        _pack(field, out)
+        out.append(ord(code))
+    _varint(len(data), out)
+    for field, code in schema.fields:
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            out += numpy.ascontiguousarray(data[field], '<' + code)
+            continue
+        column = array.array('B' if code == '?' else code, map(attrgetter(
+          field), data))
+        if sys.byteorder == 'big':
+            column.byteswap()
+        out += memoryview(column)
+
+
+def _unpack_table(binary, pos):
+    """Reads records saved by :py:func:`_pack_table` at pos, returns them\
+    and position after them.*
+    """
+    kind = binary[pos]
+    name, pos = _unpack(binary, pos + 1)
+    count, pos = _read_varint(binary, pos)
+    fields = []
+    for x in range(count):
+        field, pos = _unpack(binary, pos)
+        fields.append((field, chr(binary[pos])))
+        pos += 1
+    schema = _find_schema(name, fields)
+    count, pos = _read_varint(binary, pos)
+    end = pos + count * sum(_SIZES.get(code, 1) for field, code in fields)
+    if end > len(binary):
+        raise IndexError('records outside of data')
+    if kind == _RECORDS and schema.ndarray and numpy is not None:
+        fin = numpy.empty(count, schema.dtype)
+        for field, code in fields:
+            fin[field] = numpy.frombuffer(binary, '<' + code, count, pos)
+            pos += count * _SIZES.get(code, 1)
+        return fin, end
+    columns = []
+    for field, code in fields:
+        column = array.array('B' if code == '?' else code)
+        size = count * _SIZES.get(code, 1)
+        column.frombytes(memoryview(binary)[pos:pos + size])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns.append(list(map(bool, column)) if code == '?' else column)
+        pos += size
+    fin = list(map(schema.record, *columns))
+    if kind == _RECORD:
+        return fin[0], end
+    return fin, end
+
+
+def _unpack(binary, pos, table=None):
+    """Reads one value in format version 2 at pos, returns value and\
+    position after it; table is list of repeated values of file.*
+    """
+    tag = binary[pos]
+    pos += 1
+    if tag == _INT:
+        number, pos = _read_varint(binary, pos)
+        return (number >> 1) ^ -(number & 1), pos
+    elif tag == _STR:
+        size, pos = _read_varint(binary, pos)
+        end = pos + size
+        if end > len(binary):
+            raise IndexError('string outside of data')
+        return str(binary[pos:end], 'utf-8', 'surrogatepass'), end
+    elif tag == _FLOAT:
+        return _DOUBLE.unpack_from(binary, pos)[0], pos + 8
+    elif tag == _LIST:
+        size, pos = _read_varint(binary, pos)
+        fin = []
+        for x in range(size):
+            value, pos = _unpack(binary, pos, table)
+            fin.append(value)
+        return fin, pos
+    elif tag == _DICT:
+        size, pos = _read_varint(binary, pos)
+        fin = {}
+        for x in range(size):
+            key, pos = _unpack(binary, pos, table)
+            fin[key], pos = _unpack(binary, pos, table)
+        return fin, pos
+    elif tag == _REF:
+        number, pos = _read_varint(binary, pos)
+        value = table[number]
+        # strings are shared, lists are copied so changing one doesn't
+        # change others
+        return value[:] if type(value) is list else value, pos
+    elif tag == _NONE:
+        return None, pos
+    elif tag == _FALSE:
+        return False, pos
+    elif tag == _TRUE:
+        return True, pos
+    elif tag == _BYTES:
+        size, pos = _read_varint(binary, pos)
+        end = pos + size
+        if end > len(binary):
+            raise IndexError('bytes outside of data')
+        return memoryview(binary)[pos:end], end
+    elif tag == _ARRAY:
+        return _unpack_array(binary, pos)
+    elif tag == _TABLE:
+        return _unpack_table(binary, pos)
+    elif tag == _TOMBSTONE:
+        return DELETED, pos
+    raise KnowledgeError('unknown tag ' + str(tag) + ' at ' + str(pos - 1))
+
+
+def data_bytes_v2(data):
+    """Function that data(number, string, list...) converts to bytes in\
+    format version 2.
+
+    Integers are stored as zigzag varints, floats as 8-byte IEEE-754 and
+    strings, bytes, lists and dicts are prefixed by their length.
+    """
+    final = bytearray()
+    _pack(data, final)
+    return final
+
+
+def bytes_data_v2(binary):
+    """Function that bytes in format version 2 converts to data(numbers,\
+    strings...).
+
+    Saved bytes are returned as memoryview of binary.
+    """
+    pos = 0
+    end = len(binary)
+    while pos < end:
+        value, pos = _unpack(binary, pos)
+        yield value
+
+
+def _copy(data):
+    """Returns copy of data which isn't affected by later changes of data.*
+    """
+    kind = type(data)
+    if kind is list or kind is tuple or kind is TrackedList:
+        if set(map(type, data)) <= _IMMUTABLE:
+            return data if kind is tuple else data[:]
+        return [_copy(x) for x in data]
+    elif kind is dict or kind is TrackedDict:
+        if set(map(type, data.values())) <= _IMMUTABLE:
+            return dict(data)
+        fin = {}
+        for key in data:
+            fin[key] = _copy(data[key])
+        return fin
+    elif kind is bytearray or kind is memoryview:
+        return bytes(data)
+    elif kind is array.array:
+        return data[:]
+    elif numpy is not None and isinstance(data, numpy.ndarray):
+        return data.copy()
+    elif isinstance(data, _Record):
+        return type(data)(*data)
+    return data
+
+
+def _snapshot(data):
+    """Returns frozen copy of dict data, :py:func:`_thaw` returns it back.*
+
+    pickle copies whole dict in C, which is much faster than copying it
+    value by value (marshal would be faster, but it turns arrays into bytes);
+    loaded bytes (memoryviews) are pickled by :py:func:`_pickle` and types
+    pickle doesn't know are copied by :py:func:`_copy`.
+    """
+    try:
+        return _pickle(data)
+    except (TypeError, pickle.PicklingError):
+        return _copy(data)
+
+
+def _thaw(snapshot):
+    """Returns dict from :py:func:`_snapshot`.*
+    """
+    if type(snapshot) is bytes:
+        return pickle.loads(snapshot)
+    return snapshot
+
+
+def _sync(output):
+    """Writes output file to disk.*
+    """
+    output.flush()
+    os.fsync(output.fileno())
+
+
+def _sync_directory(filename):
+    """Writes directory entry of renamed file to disk (where it's\
+    possible).*
+    """
+    try:
+        directory = os.open(os.path.dirname(os.path.abspath(filename)),
+          os.O_RDONLY)
+    except OSError:
+        return  # directories can't be opened on Windows
+    try:
+        os.fsync(directory)
+    except OSError:
+        pass
+    finally:
+        os.close(directory)
+
+
+def _write_file(filename, binary):
+    """Writes binary to temporary file which then replaces file filename.*
+
+    Old file stays untouched until it's replaced, so memory-mapped values
+    of it stay valid, and temporary file is synced to disk before, so crash
+    leaves either old or new file.
+    """
+    with open(filename + '.tmp', 'wb') as output:
+        output.write(binary)
+        _sync(output)
+    os.replace(filename + '.tmp', filename)
+    _sync_directory(filename)
+
+
+def _header(version=VERSION, flags=0):
+    """Returns header of Knowledge file.*
+    """
+    return MAGIC + bytes((version, flags))
+
+
+def _read_header(binary):
+    """Returns version, flags and start of data of Knowledge file.*
+    """
+    if binary[:len(MAGIC)] != MAGIC:
+        return 1, 0, 0
+    if len(binary) < len(MAGIC) + 2:
+        raise KnowledgeError('truncated header')
+    version = binary[len(MAGIC)]
+    if version > VERSION:
+        raise KnowledgeError('unsupported format version ' + str(version))
+    return version, binary[len(MAGIC) + 1], len(MAGIC) + 2
+
+
+class _Stored:
+    """Codec of blocks which aren't compressed (in files with checksums).*
+    """
+    @staticmethod
+    def compress(data):
+        return bytes(data)
+
+    decompress = compress
+
+
+def _codec(number):
+    """Returns module of compression codec with given number (0 means no\
+    compression).*
+    """
+    if not 0 <= number <= len(_CODECS):
+        raise KnowledgeError('unknown compression ' + str(number))
+    if not number:
+        return _Stored
+    return import_module(_CODECS[number - 1])
+
+
+def _pack_block(module, raw, out, checked=False):
+    """Appends block of raw records compressed by module to out, returns\
+    position and size of compressed data.*
+
+    If checked is ``True``, block header has CRC32 of compressed data.
+    """
+    packed = module.compress(raw)
+    if checked:
+        out += _CHECKED_BLOCK.pack(len(raw), len(packed), zlib.crc32(packed))
+    else:
+        out += _BLOCK.pack(len(raw), len(packed))
+    pos = len(out)
+    out += packed
+    return pos, len(packed)
+
+
+def _check(packed, crc):
+    """Raises :py:exc:`KnowledgeError` if packed doesn't have CRC32 crc.*
+    """
+    if zlib.crc32(packed) != crc:
+        raise KnowledgeError('block has wrong checksum')
+
+
+def _read_table(binary, pos):
+    """Reads table of repeated values at pos, returns it and position after\
+    it.*
+    """
+    size = _OFFSET.unpack_from(binary, pos)[0]
+    pos += _OFFSET.size
+    end = pos + size
+    count, pos = _read_varint(binary, pos)
+    table = []
+    for x in range(count):
+        value, pos = _unpack(binary, pos)
+        table.append(value)
+    if pos != end:
+        raise KnowledgeError('damaged table of repeated values')
+    return table, end
+
+
+def _pack_index(keys, offsets, out, base=0, blocks=None):
+    """Appends key index, table of compressed blocks and footer with\
+    position of index to out, which starts at position base of file.*
+    """
+    start = base + len(out)
+    _varint(len(offsets), out)
+    for key, offset in zip(keys, offsets):
+        _pack(key, out)
+        _varint(offset, out)
+    if blocks is not None:
+        _varint(len(blocks), out)
+        for block in blocks:
+            for number in block:
+                _varint(number, out)
+    out += _OFFSET.pack(start)
+
+
+def _read_index(binary, compressed=False, base=0):
+    """Returns dict of values positions, start of index and list of\
+    compressed blocks (position, size, decompressed size) of indexed\
+    Knowledge file, whose end from position base is binary.*
+
+    In compressed files value position is counted in decompressed blocks.
+    """
+    start = _OFFSET.unpack_from(binary, len(binary) - _OFFSET.size)[0]
+    count, pos = _read_varint(binary, start - base)
+    offsets = {}
+    for x in range(count):
+        key, pos = _unpack(binary, pos)
+        offsets[key], pos = _read_varint(binary, pos)
+    blocks = None
+    if compressed:
+        blocks = []
+        count, pos = _read_varint(binary, pos)
+        for x in range(count):
+            block = []
+            for y in range(3):
+                number, pos = _read_varint(binary, pos)
+                block.append(number)
+            blocks.append(tuple(block))
+    return offsets, start, blocks
+
+
+def _read_segments(binary, pos):
+    """Reads directory of segments at pos, returns list of their sizes and\
+    position of first segment.*
+    """
+    size = _OFFSET.unpack_from(binary, pos)[0]
+    pos += _OFFSET.size
+    end = pos + size
+    count, pos = _read_varint(binary, pos)
+    sizes = []
+    for x in range(count):
+        number, pos = _read_varint(binary, pos)
+        sizes.append(number)
+    if pos != end:
+        raise KnowledgeError('damaged directory of segments')
+    return sizes, end
+
+
+def _encode_segment(items, codec=0, checked=False):
+    """Returns records of (key, value) items pickled by :py:func:`_pickle`\
+    as segment of file body; runs in worker process of\
+    :py:meth:`Knowledge.save_data`.*
+    """
+    items = pickle.loads(items)
+    out = bytearray()
+    block = bytearray()
+    module = (codec or checked) and _codec(codec)
+    for key, value in items:
+        _pack(key, block)
+        _pack(value, block)
+        if module and len(block) >= _BLOCK_SIZE:
+            _pack_block(module, block, out, checked)
+            block = bytearray()
+    if not module:
+        return block
+    if block:
+        _pack_block(module, block, out, checked)
+    return out
+
+
+def _reduce_memoryview(view):
+    """Pickles memoryview as its bytes.*
+    """
+    return memoryview, (view.tobytes(),)
+
+
+_DISPATCH = copyreg.dispatch_table.copy()
+_DISPATCH[memoryview] = _reduce_memoryview
+
+
+def _pickle(data):
+    """Returns data pickled with memoryviews (loaded bytes), which worker\
+    pool can't pickle.*
+    """
+    out = io.BytesIO()
+    pickler = pickle.Pickler(out, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = _DISPATCH
+    pickler.dump(data)
+    return out.getvalue()
+
+
+def _decode_segment(filename, pos, size, codec=0, checked=False):
+    """Returns pickled list of (key, value) records of segment of file;\
+    runs in worker process of :py:func:`load`.*
+
+    Records are pickled here, because decoded bytes are memoryviews, which
+    can't be pickled by worker pool.
+    """
+    with open(filename, 'rb') as infile:
+        infile.seek(pos)
+        binary = bytearray(infile.read(size))
+    if len(binary) < size:
+        raise KnowledgeError(filename + ' is truncated')
+    records = []
+    try:
+        for part, pos, stop in _body(binary, 0, size, codec, checked):
+            while pos < stop:
+                key, pos = _unpack(part, pos)
+                value, pos = _unpack(part, pos)
+                records.append((key, value))
+    except (IndexError, struct.error):
+        raise KnowledgeError(filename + ' has damaged segment')
+    return _pickle(records)
+
+
+def _body(binary, pos, end, codec=0, checked=False, torn=None):
+    """Generator of (binary, start, end) parts of file body which contain\
+    whole records; compressed blocks are decompressed and checksums of\
+    blocks are checked.*
+
+    If torn is list, last block which is cut or has wrong checksum (torn
+    append of journal) isn't error; its position is appended to torn.
+    """
+    if not codec and not checked:
+        yield binary, pos, end
+        return
+    module = _codec(codec)
+    while pos < end:
+        start = pos
+        try:
+            if checked:
+                raw, size, crc = _CHECKED_BLOCK.unpack_from(binary, pos)
+                pos += _CHECKED_BLOCK.size
             else:
-                ret.append(x)
-        else:
-            if x == 0:
-                thing = 'integer'
-                ret = 0
-            elif x == 1:
-                thing = 'string'
-                ret = ''
-            elif x == 3:
-                thing = 'list'
-                ret = bytearray()
-
-
-def load(filename, ext='.knw'):
-    """Function that loads saved data and returns Knowledge object.
+                raw, size = _BLOCK.unpack_from(binary, pos)
+                pos += _BLOCK.size
+            if pos + size > end:
+                raise IndexError('block outside of data')
+            if checked:
+                _check(binary[pos:pos + size], crc)
+        except KnowledgeError:
+            if torn is None or pos + size < end:
+                raise
+            torn.append(start)
+            return
+        except (IndexError, struct.error):
+            if torn is None:
+                raise
+            torn.append(start)
+            return
+        block = module.decompress(binary[pos:pos + size])
+        pos += size
+        yield block, 0, len(block)
 
-    :param str filename: name of data file without extension
-    :param str ext: extension of data file
-    :returns: data from file
-    :rtype: :py:class:`Knowledge`
+
+class _Writer:
+    """Class which builds Knowledge file in format version 2 record by\
+    record.*
+
+    Finished part of file can be taken by :py:meth:`take`, so whole file
+    doesn't have to be in memory. If intern is ``True``, all records have
+    to be passed to :py:meth:`count` before first :py:meth:`add`. If checked
+    is ``True``, records are saved in blocks with checksums even if they
+    aren't compressed. If journal is ``True``, file has no index, because
+    more records are appended to it later, and its header says it's journal,
+    so cut last append is ignored when it's loaded.
     """
-    with open(filename + ext, 'rb') as infile:
-        a = bytearray(infile.read())
-    res = Knowledge(filename)
-    state = 'key'
-    key = None
-    data = None
-    for x in bytes_data(a):
-        if state == 'key':
-            key = x
-            state = 'data'
-        else:
+    def __init__(self, indexed=False, codec=0, intern=False, checked=False,
+          journal=False):
+        self.indexed = not journal and (indexed or bool(codec) or checked)
+        self.codec = (codec or checked) and _codec(codec)
+        self.checked = checked
+        self.out = bytearray(_header(flags=(_INDEXED if self.indexed else 0)
+          | (_COMPRESSED if codec else 0) | (_INTERNED if intern else 0) |
+          (_CHECKED if checked else 0) | (_JOURNAL if journal else 0)))
+        if codec:
+            self.out.append(codec)
+        self.counts = {} if intern else None
+        self.refs = None
+        self.written = 0
+        self.keys = []
+        self.offsets = []
+        self.blocks = []
+        self.block = bytearray()
+        self.raw = 0
+
+    def count(self, key, value):
+        """Counts repeated strings and lists in record of key and value.*
+        """
+        _count(key, self.counts)
+        _count(value, self.counts)
+
+    def _table(self):
+        """Adds table of values which are repeated.*
+        """
+        self.refs = {}
+        table = bytearray()
+        for value in self.counts:
+            if self.counts[value] > 1:
+                self.refs[value] = len(self.refs)
+        _varint(len(self.refs), table)
+        for value in self.refs:
+            _pack(value if type(value) is str else value[0], table)
+        self.out += _OFFSET.pack(len(table))
+        self.out += table
+        self.counts = None
+
+    def add(self, key, value):
+        """Adds record of key and value.*
+        """
+        if self.counts is not None:
+            self._table()
+        if self.codec:
+            out, base = self.block, self.raw
+        else:
+            out, base = self.out, self.written
+        _pack(key, out, self.refs)
+        if self.indexed:
+            self.keys.append(key)
+            self.offsets.append(base + len(out))
+        _pack(value, out, self.refs)
+        if self.codec and len(out) >= _BLOCK_SIZE:
+            self._flush()
+
+    def add_packed(self, key, record, size):
+        """Adds record of key which is already packed; key is in the first\
+        size bytes of record (strings and lists aren't interned then).*
+        """
+        if self.counts is not None:
+            self._table()
+        if self.codec:
+            out, base = self.block, self.raw
+        else:
+            out, base = self.out, self.written
+        if self.indexed:
+            self.keys.append(key)
+            self.offsets.append(base + len(out) + size)
+        out += record
+        if self.codec and len(out) >= _BLOCK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Compresses current block.*
+        """
+        pos, size = _pack_block(self.codec, self.block, self.out, self.checked)
+        self.blocks.append((self.written + pos, size, len(self.block)))
+        self.raw += len(self.block)
+        self.block = bytearray()
+
+    def finish(self):
+        """Adds last block and index.*
+        """
+        if self.counts is not None:
+            self._table()
+        if self.block:
+            self._flush()
+        if self.indexed:
+            _pack_index(self.keys, self.offsets, self.out, self.written,
+              self.blocks if self.codec else None)
+
+    def take(self):
+        """Returns part of file which wasn't taken yet.*
+        """
+        part = self.out
+        self.written += len(part)
+        self.out = bytearray()
+        return part
+
+
+class SortedIndex:
+    """Index of keys sorted by number in their values, for
+    :py:meth:`Knowledge.range`.
+
+    Values whose number isn't int or float (or extractor raises
+    ``LookupError`` or ``TypeError``) aren't in index.
+
+    :param extractor: function which returns number from value; if it's\
+    ``None``, value itself is used
+    """
+    needs_value = True
+
+    def __init__(self, extractor=None):
+        self.extractor = extractor
+        self.keys = []
+        self.numbers = []
+        self.values = {}
+
+    def add(self, key, value):
+        """Adds key with value to index (old value of key is removed).
+        """
+        self.remove(key)
+        try:
+            number = value if self.extractor is None else self.extractor(value)
+        except (LookupError, TypeError):
+            return
+        if type(number) not in (int, float) or number != number:
+            return
+        pos = bisect_right(self.numbers, number)
+        self.numbers.insert(pos, number)
+        self.keys.insert(pos, key)
+        self.values[key] = number
+
+    def remove(self, key):
+        """Removes key from index if it's there.
+        """
+        number = self.values.pop(key, None)
+        if number is None:
+            return
+        pos = bisect_left(self.numbers, number)
+        pos = self.keys.index(key, pos, bisect_right(self.numbers, number))
+        del self.numbers[pos]
+        del self.keys[pos]
+
+    def range(self, low, high):
+        """Returns list of keys with number from low to high (both\
+        included), sorted by number.
+        """
+        return self.keys[bisect_left(self.numbers, low):
+          bisect_right(self.numbers, high)]
+
+    def dump(self):
+        """Returns index as data which can be saved.*
+        """
+        return {'type': 'sorted', 'keys': self.keys, 'numbers': self.numbers}
+
+    def restore(self, saved):
+        """Restores index from data returned by :py:meth:`dump`.*
+        """
+        self.keys = list(saved['keys'])
+        self.numbers = list(saved['numbers'])
+        self.values = dict(zip(self.keys, self.numbers))
+
+
+class PrefixIndex:
+    """Index of sorted string keys, for :py:meth:`Knowledge.prefix`.
+    """
+    needs_value = False
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, key, value=None):
+        """Adds key to index if it's string.
+        """
+        if type(key) is str:
+            pos = bisect_left(self.keys, key)
+            if pos == len(self.keys) or self.keys[pos] != key:
+                self.keys.insert(pos, key)
+
+    def remove(self, key):
+        """Removes key from index if it's there.
+        """
+        if type(key) is str:
+            pos = bisect_left(self.keys, key)
+            if pos < len(self.keys) and self.keys[pos] == key:
+                del self.keys[pos]
+
+    def prefix(self, text):
+        """Returns sorted list of keys which start with text.
+        """
+        start = bisect_left(self.keys, text)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(text):
+            end += 1
+        return self.keys[start:end]
+
+    def dump(self):
+        """Returns index as data which can be saved.*
+        """
+        return {'type': 'prefix', 'keys': self.keys}
+
+    def restore(self, saved):
+        """Restores index from data returned by :py:meth:`dump`.*
+        """
+        self.keys = list(saved['keys'])
+
+
+_INDEX_TYPES = {'sorted': SortedIndex, 'prefix': PrefixIndex}
+
+
+class Knowledge:
+    """Class for all data in program.
+
+    :param str filename: name of data file without extension
+    :param str ext: extension of data file
+    :param int version: format version used by :py:meth:`save_data` (1 is\
+    the old format, kept for older readers)
+    :param bool index: if ``True`` file ends with index of keys, so it can\
+    be loaded lazily (see :py:func:`load`)
+    :param bool journal: if ``True`` :py:meth:`save_data` appends only\
+    changed keys to the end of file (index and compression aren't used then;\
+    with checksum every append is one block with checksum)
+    :param str compress: name of compression ('zlib', 'lzma' or 'bz2');\
+    records are compressed in blocks of about 64 KiB, file has index then
+    :param bool intern: if ``True`` strings and small lists which are saved\
+    more times are saved only once in table at the start of file; loaded\
+    strings are then shared
+    :param bool checksum: if ``True`` records are saved in blocks of about\
+    64 KiB with CRC32 checksums (even without compression), file has index\
+    then
+    :param float commit_window: if given, :py:meth:`save_data` saves on\
+    background thread like :py:meth:`save_async` and waits that many\
+    seconds before writing, so all saves in that time are written (and\
+    synced to disk) only once (journal appends are joined, indexes are\
+    saved after)
+    :param bool track: if ``True`` saved form of every value is kept and\
+    :py:meth:`save_data` encodes only values which changed since last save;\
+    lists and dicts are replaced by :py:class:`TrackedList` and\
+    :py:class:`TrackedDict` when they are set or got, so change them only\
+    through values got from this object; values with other mutable parts\
+    (arrays, bytearrays, records...) are encoded in every save (not used\
+    with intern)
+    """
+    def __init__(self, filename, ext='.knw', version=VERSION, index=False,
+          journal=False, compress=None, intern=False, checksum=False,
+          commit_window=None, track=False):
+        if journal and version < 2:
+            raise ValueError("Journal needs format version 2 or newer")
+        if compress is not None and (compress not in _CODECS or version < 2):
+            raise ValueError("Unknown compression " + repr(compress))
+        if intern and version < 2:
+            raise ValueError("Interning needs format version 2 or newer")
+        if checksum and version < 2:
+            raise ValueError("Checksums need format version 2 or newer")
+        self.data = {}
+        self.name = filename
+        self.ext = ext
+        self.filename = filename + ext
+        self.version = version
+        self.index = index
+        self.journal = journal
+        self.compress = compress
+        self.intern = intern
+        self.checksum = checksum
+        self.commit_window = commit_window
+        self.track = track
+        self._encoded = {}
+        self.save = bytearray()
+        self._torn = None
+        self._lazy = {}
+        self._buffer = None
+        self._blocks = None
+        self._starts = None
+        self._codec = None
+        self._cache = {}
+        self._table = None
+        self._changed = {}
+        self._appendable = False
+        self._lock = Lock()
+        self._executor = None
+        self._pending = []
+        self._pending_indexes = None
+        self._saving = None
+        self.indexes = {}
+        self._unchanged = False
+
+    def __repr__(self):
+        self.load_all()
+        self.ret = ''
+        for x in self.data:
+            self.ret += str(x)
+            self.ret += ' : '
+            self.ret += str(self.data[x])
+            self.ret += '\n'
+        return self.ret[:-1]  # so last \n is deleted
+
+    def __getitem__(self, key):
+        try:
+            value = self.data[key]
+        except KeyError:
+            if key not in self._lazy:
+                raise
+            value = self.data[key] = self._decode(self._lazy.pop(key))
+        if self.track and (type(value) is list or type(value) is dict):
+            # values which weren't got can't be changed, so their saved form
+            # stays valid
+            value = self.data[key] = _track(value, partial(
+              self._encoded.pop, key, None))
+        return value
+
+    def __setitem__(self, key, value):
+        if self.track:
+            self._encoded.pop(key, None)
+            value = _track(value, partial(self._encoded.pop, key, None))
+        self.data[key] = value
+        self._lazy.pop(key, None)
+        self._unchanged = False
+        if self.journal:
+            self._changed[key] = True
+        for index in self.indexes.values():
+            index.add(key, value)
+
+    def __delitem__(self, key):
+        if key in self._lazy:
+            del self._lazy[key]
+        else:
+            del self.data[key]
+        self._encoded.pop(key, None)
+        self._unchanged = False
+        if self.journal:
+            self._changed[key] = True
+        for index in self.indexes.values():
+            index.remove(key)
+
+    def __contains__(self, key):
+        return key in self.data or key in self._lazy
+
+    def __iter__(self):
+        for key in list(self.data):
+            yield key
+        for key in list(self._lazy):
+            yield key
+
+    def __len__(self):
+        return len(self.data) + len(self._lazy)
+
+    def load_all(self):
+        """Decodes all values which weren't decoded yet (only useful if\
+        object was loaded lazily).
+        """
+        for key in sorted(self._lazy, key=self._lazy.get):
+            self.data[key] = self._decode(self._lazy[key])
+        self._lazy = {}
+        self._cache = {}
+        if self._buffer is not None:
+            try:
+                self._buffer.close()
+            except BufferError:
+                pass  # numpy arrays use it, it's closed when they're deleted
+            self._buffer = None
+
+    def add_index(self, name, index):
+        """Adds secondary index which is then kept up to date when keys are\
+        set or deleted.
+
+        If index with the same name and type was saved with this file (see\
+        :py:meth:`save_data`), file wasn't changed since and no key was set\
+        or deleted since this object was loaded from file (or saved), saved\
+        index is used, otherwise index is built from all data.
+
+        :param str name: name of index ('value' and 'prefix' are used by\
+        default by :py:meth:`range` and :py:meth:`prefix`)
+        :param index: empty index
+        :type index: :py:class:`SortedIndex` or :py:class:`PrefixIndex`
+        :returns: index
+        """
+        saved = self._unchanged and self._saved_indexes().get(name)
+        if saved and _INDEX_TYPES[saved['type']] is type(index):
+            index.restore(saved)
+        else:
+            for key in self:
+                index.add(key, self[key] if index.needs_value else None)
+        self.indexes[name] = index
+        return index
+
+    def range(self, low, high, name='value'):
+        """Returns keys whose number in index name is from low to high (both\
+        included), sorted by that number.
+
+        :rtype: list
+        """
+        return self.indexes[name].range(low, high)
+
+    def prefix(self, text, name='prefix'):
+        """Returns sorted keys which start with text, using index name.
+
+        :rtype: list
+        """
+        return self.indexes[name].prefix(text)
+
+    def _saved_indexes(self):
+        """Returns dict of indexes saved with file, if file wasn't changed\
+        since they were saved.*
+        """
+        try:
+            saved = load(self.name, self.ext + '.idx')
+            info = os.stat(self.filename)
+        except (OSError, KnowledgeError):
+            return {}
+        if list(saved['file']) != [info.st_size, info.st_mtime_ns]:
+            return {}
+        return saved['indexes']
+
+    def _save_indexes(self, indexes=None):
+        """Saves indexes (or their dumps) to file next to data file.*
+        """
+        if indexes is None:
+            indexes = {name: self.indexes[name].dump() for name in
+              self.indexes}
+        info = os.stat(self.filename)
+        saved = Knowledge(self.name, self.ext + '.idx')
+        saved['file'] = [info.st_size, info.st_mtime_ns]
+        saved['indexes'] = indexes
+        saved.save_data()
+
+    def _decode(self, offset):
+        """Returns value of lazily loaded file at offset.*
+        """
+        if self._blocks is None:
+            return _unpack(self._buffer, offset, self._table)[0]
+        number = bisect_right(self._starts, offset) - 1
+        block = self._cache.pop(number, None)
+        if block is None:
+            if len(self._cache) >= _CACHED_BLOCKS:
+                del self._cache[next(iter(self._cache))]
+            start, size, raw = self._blocks[number]
+            if self.checksum:
+                _check(self._buffer[start:start + size],
+                  _CHECKED_BLOCK.unpack_from(self._buffer,
+                  start - _CHECKED_BLOCK.size)[2])
+            block = self._codec.decompress(self._buffer[start:start + size])
+        self._cache[number] = block
+        return _unpack(block, offset - self._starts[number], self._table)[0]
+
+    def save_data(self, workers=None):
+        """Saves all data.
+
+        In journal mode only keys changed since last save are appended to
+        file (all data are written if file wasn't saved or loaded before).
+        Waits for saves started by :py:meth:`save_async`. Secondary indexes
+        (see :py:meth:`add_index`) are saved to file with extension
+        ``.idx`` added.
+
+        :param int workers: if given, keys are split into segments which are\
+        encoded (and compressed) by that many processes; file then has\
+        directory of segments instead of index, so it can be loaded by more\
+        processes too, but not lazily (not used in journal mode and format\
+        version 1)
+        :returns: future with file name as result if object has\
+        commit_window (data are copied and written on background thread,\
+        like by :py:meth:`save_async`), otherwise ``None``
+        """
+        if self.commit_window:
+            if self.journal and self._appendable:
+                return self._queue(('append', self._journal_records()))
+            self.load_all()
+            future = self._queue(('file', _snapshot(self.data), workers))
+            self._changed = {}
+            self._appendable = self.journal
+            return future
+        if self._saving is not None:
+            wait((self._saving,))
+        if self.journal and self._appendable:
+            self.save = self._journal_records()
+            self._append_file(self.save)
+        else:
+            self.load_all()
+            if workers and self.version > 1 and not self.journal:
+                self.save = self._encode_segments(self.data, workers)
+            elif self.track and self.version > 1 and not self.intern:
+                self.save = self._encode_tracked()
+            else:
+                self.save = self._encode(self.data)
+            _write_file(self.filename, self.save)
+            self._changed = {}
+            self._appendable = self.journal
+        self._unchanged = True
+        if self.indexes:
+            self._save_indexes()
+
+    def save_async(self):
+        """Saves all data on background thread.
+
+        Data are copied first, so they can be changed right after call.
+        Only one file write runs at once; if more saves are waiting, only
+        the newest data are written and all their futures are done after
+        that write. With commit_window (see :py:class:`Knowledge`) write
+        waits for more saves first.
+
+        :returns: future with file name as result
+        :rtype: concurrent.futures.Future
+        """
+        self.load_all()
+        future = self._queue(('file', _snapshot(self.data), None))
+        self._changed = {}
+        self._appendable = self.journal
+        return future
+
+    def _journal_records(self):
+        """Returns records of keys changed since last save (one block with\
+        checksum if object has checksum).*
+        """
+        records = bytearray()
+        for thing in self._changed:
+            _pack(thing, records)
+            if thing in self:
+                _pack(self[thing], records)
+            else:
+                records.append(_TOMBSTONE)
+        self._changed = {}
+        if records and self.checksum:
+            block = bytearray()
+            _pack_block(_codec(0), records, block, True)
+            return block
+        return records
+
+    def _append_file(self, records):
+        """Appends records to journal file.*
+        """
+        if not records:
+            return
+        with open(self.filename, 'ab') as output:
+            if self._torn is not None:
+                # records after torn append would be unreadable
+                output.truncate(self._torn)
+                self._torn = None
+            output.write(records)
+            _sync(output)
+
+    def _queue(self, job):
+        """Adds write of file (``('file', snapshot, workers)``) or append to\
+        journal (``('append', records)``) for background thread, returns\
+        its future.*
+
+        Write of file replaces all waiting jobs, appends which wait are
+        joined. Indexes are copied too and saved after the last job.
+        """
+        indexes = _copy({name: self.indexes[name].dump() for name in
+          self.indexes}) if self.indexes else None
+        with self._lock:
+            if job[0] == 'file':
+                self._pending = [job]
+            elif self._pending and self._pending[-1][0] == 'append':
+                self._pending[-1][1].extend(job[1])
+            else:
+                self._pending.append(job)
+            self._pending_indexes = indexes
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1)
+            self._saving = self._executor.submit(self._write_pending)
+        self._unchanged = True
+        return self._saving
+
+    def _write_pending(self):
+        """Does jobs given to :py:meth:`_queue`.*
+        """
+        if self.commit_window and self._pending:
+            sleep(self.commit_window)
+        with self._lock:
+            jobs = self._pending
+            indexes = self._pending_indexes
+            self._pending = []
+            self._pending_indexes = None
+        for job in jobs:
+            if job[0] == 'append':
+                self._append_file(job[1])
+                continue
+            data = _thaw(job[1])
+            if job[2] and self.version > 1 and not self.journal:
+                _write_file(self.filename, self._encode_segments(data,
+                  job[2]))
+            else:
+                _write_file(self.filename, self._encode(data))
+        if jobs and indexes is not None:
+            self._save_indexes(indexes)
+        return self.filename
+
+    def _encode(self, data):
+        """Returns whole file with given data as bytearray.*
+        """
+        if self.version == 1:
+            fin = bytearray()
+            for thing in data:
+                fin += data_bytes(thing)
+                fin += data_bytes(data[thing])
+            return fin
+        writer = self._writer()
+        if writer.counts is not None:
+            for thing in data:
+                writer.count(thing, data[thing])
+        for thing in data:
+            writer.add(thing, data[thing])
+        writer.finish()
+        return writer.out
+
+    def _encode_tracked(self):
+        """Returns whole file as bytearray; only values which changed since\
+        last save are encoded, saved form of others is reused.*
+        """
+        writer = self._writer()
+        encoded = self._encoded
+        for thing in self.data:
+            record = encoded.get(thing)
+            if record is None:
+                value = self.data[thing]
+                record = bytearray()
+                _pack(thing, record)
+                size = len(record)
+                _pack(value, record)
+                record = (record, size)
+                # normal lists and dicts are replaced when they are got or
+                # set, so these weren't given out since load
+                if _frozen(value, True):
+                    encoded[thing] = record
+            writer.add_packed(thing, *record)
+        writer.finish()
+        return writer.out
+
+    def _encode_segments(self, data, workers):
+        """Returns whole file with given data split into segments, which are\
+        encoded by workers processes, as bytearray.*
+        """
+        items = list(data.items())
+        size = -(-len(items) // (workers * _SEGMENTS_PER_WORKER)) or 1
+        parts = [_pickle(items[x:x + size]) for x in range(0, len(items),
+          size)]
+        codec = _CODECS.index(self.compress) + 1 if self.compress else 0
+        with ProcessPoolExecutor(workers) as pool:
+            segments = list(pool.map(_encode_segment, parts, repeat(codec),
+              repeat(self.checksum)))
+        fin = bytearray(_header(flags=_SEGMENTED |
+          (_COMPRESSED if codec else 0) | (_CHECKED if self.checksum else 0)))
+        if codec:
+            fin.append(codec)
+        directory = bytearray()
+        _varint(len(segments), directory)
+        for segment in segments:
+            _varint(len(segment), directory)
+        fin += _OFFSET.pack(len(directory))
+        fin += directory
+        for segment in segments:
+            fin += segment
+        return fin
+
+    def _writer(self):
+        """Returns writer of file in format version 2 with this object's\
+        settings.*
+        """
+        if self.journal:
+            return _Writer(checked=self.checksum, journal=True)
+        return _Writer(self.index, _CODECS.index(self.compress) + 1 if
+          self.compress else 0, self.intern, self.checksum)
+
+    def compact(self):
+        """Rewrites journal file, so it contains every key only once.
+        """
+        self._appendable = False
+        self.save_data()
+
+    def begin_save(self):
+        """Starts saving of all data in small steps, without threads.
+
+        :returns: saver; call its :py:meth:`Saver.step` every frame until\
+        it returns ``True``
+        :rtype: :py:class:`Saver`
+        """
+        return Saver(self)
+
+
+class Saver:
+    """Class which saves :py:class:`Knowledge` step by step.
+
+    Keys are copied when saver is created, so setting or deleting keys
+    doesn't change saved data; values changed in place before saver is done
+    may be saved changed. Data are written to temporary file which replaces
+    old file when all keys are saved.
+
+    :param knowledge: object which will be saved
+    :type knowledge: :py:class:`Knowledge`
+    """
+    def __init__(self, knowledge):
+        self.knowledge = knowledge
+        knowledge.load_all()
+        self.items = list(knowledge.data.items())
+        self.pos = 0
+        self.done = False
+        self.writer = knowledge._writer() if knowledge.version > 1 else None
+        self.counted = len(self.items)
+        if self.writer and self.writer.counts is not None:
+            self.counted = 0
+        self.temp = knowledge.filename + '.part'
+        self.output = open(self.temp, 'wb')
+        if self.writer:
+            self.output.write(self.writer.take())
+        knowledge._changed = {}
+        knowledge._appendable = False
+
+    def step(self, budget_ms=2):
+        """Saves as many keys as fits in given time.
+
+        One key is always saved, so big values can take longer. If strings
+        are interned, all keys are counted first.
+
+        :param float budget_ms: time for saving in milliseconds
+        :returns: ``True`` if saving is done
+        :rtype: bool
+        """
+        if self.done:
+            return True
+        end = perf_counter() + budget_ms / 1000
+        while self.counted < len(self.items):
+            self.writer.count(*self.items[self.counted])
+            self.counted += 1
+            if perf_counter() >= end:
+                return False
+        part = bytearray()
+        while self.pos < len(self.items):
+            thing, value = self.items[self.pos]
+            self.pos += 1
+            if self.writer:
+                self.writer.add(thing, value)
+            else:
+                part += data_bytes(thing)
+                part += data_bytes(value)
+            if perf_counter() >= end:
+                break
+        finished = self.pos == len(self.items)
+        if self.writer:
+            if finished:
+                self.writer.finish()
+            part = self.writer.take()
+        self.output.write(part)
+        if finished:
+            self._commit()
+        return self.done
+
+    def _commit(self):
+        """Replaces old file with saved data.*
+        """
+        _sync(self.output)
+        self.output.close()
+        if self.knowledge._saving is not None:
+            wait((self.knowledge._saving,))
+        os.replace(self.temp, self.knowledge.filename)
+        _sync_directory(self.knowledge.filename)
+        self.knowledge._appendable = self.knowledge.journal
+        self.items = []
+        self.pos = 0
+        self.done = True
+
+
+class ShardedKnowledge:
+    """Class for data split into more files by hash of keys.
+
+    Every shard is :py:class:`Knowledge` saved in its own file in
+    directory. Shard is loaded when key which belongs to it is first used and
+    :py:meth:`save_data` writes only shards with keys set or deleted since
+    last save, so values changed in place have to be set again to be saved.
+
+    :param str directory: directory of shard files
+    :param int shards: number of shard files; it can't be changed for\
+    existing directory
+    :param str ext: extension of shard files
+    :param bool lazy: if ``True`` shards are loaded lazily (see\
+    :py:func:`load`)
+    :param options: other arguments of :py:class:`Knowledge` used for every\
+    shard
+    """
+    def __init__(self, directory, shards=64, ext='.knw', lazy=False,
+          **options):
+        self.directory = directory
+        self.shards = shards
+        self.ext = ext
+        self.lazy = lazy
+        self.options = options
+        self._shards = [None] * shards
+        self._dirty = set()
+        self._width = len(str(shards - 1))
+        info = os.path.join(directory, 'shards')
+        if os.path.exists(info + ext):
+            saved = load(info, ext)['shards']
+            if saved != shards:
+                raise ValueError("Directory " + repr(directory) + " has " +
+                  str(saved) + " shards")
+
+    def __repr__(self):
+        return '\n'.join(repr(self.shard(number)) for number in
+          range(self.shards) if len(self.shard(number)))
+
+    def __getitem__(self, key):
+        return self.shard(self.route(key))[key]
+
+    def __setitem__(self, key, value):
+        number = self.route(key)
+        self.shard(number)[key] = value
+        self._dirty.add(number)
+
+    def __delitem__(self, key):
+        number = self.route(key)
+        del self.shard(number)[key]
+        self._dirty.add(number)
+
+    def __contains__(self, key):
+        return key in self.shard(self.route(key))
+
+    def __iter__(self):
+        for number in range(self.shards):
+            for key in self.shard(number):
+                yield key
+
+    def __len__(self):
+        return sum(len(self.shard(number)) for number in range(self.shards))
+
+    def route(self, key):
+        """Returns number of shard of key.
+
+        Number depends only on saved form of key, so it's the same in every
+        run of program. Keys which are equal in dict (``1``, ``1.0`` and
+        ``True``) are routed like int.
+        """
+        kind = type(key)
+        if kind is bool or kind is float and key.is_integer():
+            key = int(key)
+        return zlib.crc32(data_bytes_v2(key)) % self.shards
+
+    def shard(self, number):
+        """Returns shard with given number, loads it if it isn't loaded.
+
+        :rtype: :py:class:`Knowledge`
+        """
+        shard = self._shards[number]
+        if shard is None:
+            name = os.path.join(self.directory, str(number).zfill(self._width))
+            if os.path.exists(name + self.ext):
+                shard = load(name, self.ext, self.lazy,
+                  self.options.get('journal', False))
+                for option, value in self.options.items():
+                    if option != 'journal':
+                        setattr(shard, option, value)
+            else:
+                shard = Knowledge(name, self.ext, **self.options)
+            self._shards[number] = shard
+        return shard
+
+    def save_data(self):
+        """Saves shards which were changed since last save.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        info = os.path.join(self.directory, 'shards')
+        if not os.path.exists(info + self.ext):
+            meta = Knowledge(info, self.ext)
+            meta['shards'] = self.shards
+            meta.save_data()
+        for number in sorted(self._dirty):
+            self._shards[number].save_data()
+        self._dirty = set()
+
+
+class DiskKnowledge(MutableMapping):
+    """Class for data which don't fit in memory; only recently used values\
+    are kept in memory, others are in indexed file.
+
+    Values which weren't changed are dropped from memory when cache is full,
+    changed values are appended to file first. Values changed in place have
+    to be set again, otherwise their changes can be lost. Old records stay
+    in file until :py:meth:`compact` is called. File can be read by
+    :py:func:`load` (with ``journal=True`` its later records override
+    earlier ones) after :py:meth:`save_data`.
+
+    :param str filename: name of data file without extension
+    :param str ext: extension of data file
+    :param int max_values: maximum number of values in memory
+    :param int max_bytes: maximum size of values in memory, counted in bytes\
+    of their saved form
+    """
+    def __init__(self, filename, ext='.knw', max_values=1024, max_bytes=None):
+        if max_values is not None and max_values < 1:
+            raise ValueError("Cache has to hold at least one value")
+        self.name = filename
+        self.ext = ext
+        self.filename = filename + ext
+        self.max_values = max_values
+        self.max_bytes = max_bytes
+        self._offsets = {}
+        self._cache = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._dirty = set()
+        self._indexed = False
+        self._open()
+
+    def _open(self):
+        """Opens file and reads positions of values.*
+        """
+        if not os.path.exists(self.filename):
+            with open(self.filename, 'wb') as output:
+                output.write(_header(flags=_JOURNAL))
+        self._file = open(self.filename, 'r+b')
+        head = self._file.read(len(MAGIC) + 2)
+        version, flags, pos = _read_header(head)
+        if version < 2 or flags & ~(_INDEXED | _JOURNAL):
+            self._file.close()
+            raise KnowledgeError(self.filename + ' has to be uncompressed'
+              ' file in format version 2 without table')
+        self._offsets = {}
+        if flags & _INDEXED:
+            self._file.seek(-_OFFSET.size, 2)
+            start = _OFFSET.unpack(self._file.read(_OFFSET.size))[0]
+            if start < pos:
+                self._file.close()
+                raise KnowledgeError(self.filename + ' has damaged index')
+            self._file.seek(start)
+            self._offsets, self._end = _read_index(self._file.read(),
+              base=start)[:2]
+            self._indexed = True
+        else:
+            self._scan(pos)
+
+    def _scan(self, pos):
+        """Reads positions of values from records of file after pos.*
+        """
+        self._file.seek(pos)
+        buffer = bytearray()
+        start = pos
+        while True:
+            try:
+                key, middle = _unpack(buffer, pos - start)
+                value, end = _unpack(buffer, middle)
+            except (IndexError, struct.error):
+                chunk = self._file.read(max(65536, len(buffer)))
+                if not chunk:
+                    if pos - start < len(buffer):
+                        raise KnowledgeError(self.filename + ' is truncated')
+                    break
+                buffer = buffer[pos - start:] + chunk
+                start = pos
+                continue
+            if value is DELETED:
+                self._offsets.pop(key, None)
+            else:
+                self._offsets[key] = start + middle
+            pos = start + end
+        self._end = pos
+
+    def _read(self, offset):
+        """Returns value saved at offset and size of its saved form.*
+        """
+        size = 4096
+        while True:
+            self._file.seek(offset)
+            binary = self._file.read(size)
+            try:
+                value, end = _unpack(binary, 0)
+            except (IndexError, struct.error):
+                if len(binary) < size:
+                    raise KnowledgeError(self.filename + ' is truncated')
+                size *= 4
+                continue
+            return value, end
+
+    def _append(self, key, value=DELETED):
+        """Appends record of key and value (or deletion) to file, returns\
+        position of value.*
+        """
+        if self._indexed:
+            # index is written again by save_data, until then file is journal
+            self._file.seek(len(MAGIC) + 1)
+            self._file.write(bytes((_JOURNAL,)))
+            self._file.truncate(self._end)
+            self._indexed = False
+        record = bytearray()
+        _pack(key, record)
+        offset = self._end + len(record)
+        if value is DELETED:
+            record.append(_TOMBSTONE)
+        else:
+            _pack(value, record)
+        self._file.seek(self._end)
+        self._file.write(record)
+        self._end += len(record)
+        return offset
+
+    def _remember(self, key, value, size, dirty):
+        """Adds value to cache and drops least recently used values if cache\
+        is full.*
+        """
+        self._bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if dirty:
+            self._dirty.add(key)
+        while len(self._cache) > 1 and ((self.max_values is not None and
+              len(self._cache) > self.max_values) or (self.max_bytes is not
+              None and self._bytes > self.max_bytes)):
+            old, value = self._cache.popitem(False)
+            self._bytes -= self._sizes.pop(old)
+            if old in self._dirty:
+                self._dirty.remove(old)
+                self._offsets[old] = self._append(old, value)
+
+    def __repr__(self):
+        return '\n'.join(str(key) + ' : ' + str(self[key]) for key in self)
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        value, size = self._read(self._offsets[key])
+        self._remember(key, value, size, False)
+        return value
+
+    def __setitem__(self, key, value):
+        # encoded now, so key or value which can't be saved raises here and
+        # not later, when other key drops it from cache
+        size = _saved_size(value)
+        _saved_size(key)
+        self._offsets.setdefault(key, None)
+        self._remember(key, value, size if self.max_bytes is not None else
+          0, True)
+
+    def __delitem__(self, key):
+        offset = self._offsets.pop(key)
+        if key in self._cache:
+            del self._cache[key]
+            self._bytes -= self._sizes.pop(key)
+            self._dirty.discard(key)
+        if offset is not None:
+            self._append(key)
+
+    def __contains__(self, key):
+        return key in self._offsets
+
+    def __iter__(self):
+        for key in list(self._offsets):
+            yield key
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def save_data(self):
+        """Writes changed values and index of keys to file.
+        """
+        for key in self._dirty:
+            self._offsets[key] = self._append(key, self._cache[key])
+        self._dirty = set()
+        if not self._indexed:
+            index = bytearray()
+            _pack_index(self._offsets, self._offsets.values(), index,
+              self._end)
+            self._file.seek(self._end)
+            self._file.write(index)
+            self._file.seek(len(MAGIC) + 1)
+            self._file.write(bytes((_INDEXED,)))
+            self._indexed = True
+        _sync(self._file)
+
+    def compact(self):
+        """Rewrites file, so it contains only current value of every key.
+        """
+        self.save_data()
+        writer = _Writer(True)
+        with open(self.filename + '.tmp', 'wb') as output:
+            for key in self._offsets:
+                writer.add(key, self._read(self._offsets[key])[0])
+                output.write(writer.take())
+            writer.finish()
+            output.write(writer.take())
+        self._file.close()
+        os.replace(self.filename + '.tmp', self.filename)
+        self._open()
+
+    def close(self):
+        """Saves data and closes file.
+        """
+        self.save_data()
+        self._file.close()
+
+
+def _digest(binary):
+    """Returns 128-bit digest of saved value (long enough that changed value\
+    never has the same digest).*
+    """
+    return hashlib.blake2b(binary, digest_size=16).digest()
+
+
+class SaveSlots:
+    """Class for more saves (slots) of the same data, where every slot\
+    keeps only keys which are different from base save.
+
+    Slot is restored from base and its own changes only, so restoring is as
+    fast for every slot. New base (full save) is written after rebase slots
+    or when more than half of keys changed; bases which no slot uses are
+    deleted.
+
+    :param str directory: directory of slot files
+    :param str ext: extension of slot files
+    :param int rebase: number of slots saved against one base
+    :param options: arguments of :py:class:`Knowledge` used for bases
+    """
+    def __init__(self, directory, ext='.knw', rebase=8, **options):
+        self.directory = directory
+        self.ext = ext
+        self.rebase = rebase
+        self.options = options
+        self._info = os.path.join(directory, 'slots')
+        self._sums = None
+        if os.path.exists(self._info + ext):
+            info = load(self._info, ext)
+            self.slots = {name: base for name, base in info['slots']}
+            self.base = info['base']
+            self.deltas = info['deltas']
+        else:
+            self.slots = {}
+            self.base = None
+            self.deltas = 0
+
+    def names(self):
+        """Returns names of slots from the oldest to the newest save.
+
+        :rtype: list
+        """
+        return list(self.slots)
+
+    def _path(self, name):
+        """Returns name of file of slot without extension.*
+        """
+        return os.path.join(self.directory, 'slot-' + name)
+
+    def _base_path(self, number):
+        """Returns name of file of base without extension.*
+        """
+        return os.path.join(self.directory, 'base-' + str(number))
+
+    def _base_sums(self):
+        """Returns dict of digests of saved values of current base.*
+        """
+        if self._sums is None:
+            self._sums = {key: _digest(data_bytes_v2(value)) for key, value
+              in iter_load(self._base_path(self.base), self.ext)}
+        return self._sums
+
+    def save(self, name, data):
+        """Saves data to slot name (old save in that slot is replaced).
+
+        :param data: data to save
+        :type data: :py:class:`Knowledge` or dict
+        """
+        if isinstance(data, Knowledge):
+            data.load_all()
+            data = data.data
+        os.makedirs(self.directory, exist_ok=True)
+        self.slots.pop(name, None)
+        delta = None
+        if self.base is not None and self.deltas < self.rebase:
+            sums = self._base_sums()
+            delta = bytearray(_header())
+            changed = 0
+            for key in data:
+                value = bytearray()
+                _pack(data[key], value)
+                if sums.get(key) != _digest(value):
+                    _pack(key, delta)
+                    delta += value
+                    changed += 1
+            for key in sums:
+                if key not in data:
+                    _pack(key, delta)
+                    delta.append(_TOMBSTONE)
+                    changed += 1
+            if changed * 2 > max(len(data), len(sums)):
+                delta = None
+        if delta is None:
+            self.base = 0 if self.base is None else self.base + 1
+            self.deltas = 0
+            base = Knowledge(self._base_path(self.base), self.ext,
+              **self.options)
+            base.data = data
+            base.save_data()
+            self._sums = {key: _digest(data_bytes_v2(data[key])) for key in
+              data}
+            delta = _header()
+        _write_file(self._path(name) + self.ext, delta)
+        self.deltas += 1
+        self.slots[name] = self.base
+        self._save_info()
+
+    def restore(self, name):
+        """Returns data of slot name.
+
+        Returned object isn't connected to slot files; its file name is name
+        of slot.
+
+        :rtype: :py:class:`Knowledge`
+        """
+        base = self.slots[name]
+        res = load(self._base_path(base), self.ext)
+        res.name = name
+        res.filename = name + self.ext
+        for key, value in iter_load(self._path(name), self.ext):
+            if value is DELETED:
+                res.data.pop(key, None)
+            else:
+                res.data[key] = value
+        return res
+
+    def delete(self, name):
+        """Deletes slot name.
+        """
+        del self.slots[name]
+        os.remove(self._path(name) + self.ext)
+        self._save_info()
+
+    def _save_info(self):
+        """Saves list of slots and deletes bases which aren't used.*
+        """
+        info = Knowledge(self._info, self.ext)
+        info['slots'] = [[name, self.slots[name]] for name in self.slots]
+        info['base'] = self.base
+        info['deltas'] = self.deltas
+        info.save_data()
+        used = set(self.slots.values())
+        used.add(self.base)
+        for number in range(self.base):
+            path = self._base_path(number) + self.ext
+            if number not in used and os.path.exists(path):
+                os.remove(path)
+
+
+_MESSAGE = struct.Struct('<I')
+
+
+def _message(value, out):
+    """Appends value in format version 2 with its size to out (message for\
+    socket).*
+    """
+    start = len(out)
+    out += bytes(_MESSAGE.size)
+    _pack(value, out)
+    _MESSAGE.pack_into(out, start, len(out) - start - _MESSAGE.size)
+
+
+def _receive(infile):
+    """Reads value of message (see :py:func:`_message`) from file of\
+    socket, returns ``None`` if connection was closed.*
+    """
+    head = infile.read(_MESSAGE.size)
+    if len(head) < _MESSAGE.size:
+        return None
+    size = _MESSAGE.unpack(head)[0]
+    binary = bytearray(infile.read(size))
+    if len(binary) < size:
+        raise KnowledgeError('connection closed in the middle of message')
+    return _unpack(binary, 0)[0]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Handler of one connection to :py:class:`KnowledgeServer`.*
+    """
+    def handle(self):
+        server = self.server
+        while True:
+            request = _receive(self.rfile)
+            if request is None:
+                return
+            out = bytearray()
+            try:
+                with server.lock:
+                    result = server.run(request[0], request[1:])
+                # encoded here, so values which can't be saved are errors
+                _message(['ok', result], out)
+            except KeyError as error:
+                _message(['KeyError', error.args[0] if error.args else None],
+                  out)
+            except Exception as error:
+                del out[:]
+                _message(['error', type(error).__name__ + ': ' + str(error)],
+                  out)
+            self.connection.sendall(out)
+
+
+def _remove_socket(path):
+    """Removes socket file path if it exists; other files aren't removed.*
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(path + " exists and isn't socket")
+    os.remove(path)
+
+
+class KnowledgeServer(socketserver.ThreadingMixIn,
+      socketserver.UnixStreamServer):
+    """Server which shares one :py:class:`Knowledge` with more processes\
+    over Unix domain socket (see :py:class:`KnowledgeClient`).
+
+    Requests are done one by one, so server is the only writer of file.
+    Call :py:meth:`serve_forever` (on its own thread if needed) to handle
+    requests.
+
+    :param str path: path of socket (old socket file is replaced)
+    :param knowledge: shared data
+    :type knowledge: :py:class:`Knowledge`
+    :raises FileExistsError: if path exists and isn't socket
+    """
+    daemon_threads = True
+
+    def __init__(self, path, knowledge):
+        _remove_socket(path)
+        self.knowledge = knowledge
+        self.lock = Lock()
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+
+    def run(self, command, args):
+        """Runs one command of client and returns its result.*
+        """
+        knowledge = self.knowledge
+        if command == 'get':
+            return knowledge[args[0]]
+        elif command == 'set':
+            knowledge[args[0]] = args[1]
+        elif command == 'delete':
+            del knowledge[args[0]]
+        elif command == 'contains':
+            return args[0] in knowledge
+        elif command == 'get_many':
+            return [knowledge[key] if key in knowledge else args[1] for key in
+              args[0]]
+        elif command == 'set_many':
+            for key, value in args[0]:
+                knowledge[key] = value
+        elif command == 'len':
+            return len(knowledge)
+        elif command == 'keys':
+            return list(knowledge)
+        elif command == 'save':
+            knowledge.save_data()
+        else:
+            raise ValueError('unknown command ' + repr(command))
+        return None
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        _remove_socket(self.server_address)
+
+
+class KnowledgeClient(MutableMapping):
+    """Client of :py:class:`KnowledgeServer` with the same mapping methods\
+    as :py:class:`Knowledge`.
+
+    Connections are kept open and reused, so client can be used from more
+    threads.
+
+    :param str path: path of socket of server
+    :param int pool_size: maximum number of open connections which aren't\
+    used
+    """
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        self.pool_size = pool_size
+        self._idle = []
+        self._lock = Lock()
+
+    def _connect(self):
+        """Returns unused connection to server.*
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self.path)
+        return connection, connection.makefile('rb')
+
+    def _release(self, connection):
+        """Returns connection to pool (or closes it if pool is full).*
+        """
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(connection)
+                return
+        connection[1].close()
+        connection[0].close()
+
+    def _call(self, requests):
+        """Sends requests at once, returns list of their results.*
+        """
+        connection = self._connect()
+        try:
+            out = bytearray()
+            for request in requests:
+                _message(request, out)
+            connection[0].sendall(out)
+            responses = [_receive(connection[1]) for request in requests]
+            if None in responses:
+                raise KnowledgeError('server closed connection')
+        except BaseException:
+            connection[1].close()
+            connection[0].close()
+            raise
+        self._release(connection)
+        results = []
+        for response in responses:
+            status, result = response
+            if status == 'KeyError':
+                result = KeyError(result)
+            elif status != 'ok':
+                result = KnowledgeError(result)
+            results.append(result)
+        return results
+
+    def _call_one(self, *request):
+        """Sends one request, returns its result or raises its error.*
+        """
+        result = self._call([list(request)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def __getitem__(self, key):
+        return self._call_one('get', key)
+
+    def __setitem__(self, key, value):
+        self._call_one('set', key, value)
+
+    def __delitem__(self, key):
+        self._call_one('delete', key)
+
+    def __contains__(self, key):
+        return self._call_one('contains', key)
+
+    def __iter__(self):
+        for key in self._call_one('keys'):
+            yield key
+
+    def __len__(self):
+        return self._call_one('len')
+
+    def get_many(self, keys, default=None):
+        """Returns list of values of keys (default for missing keys).
+        """
+        return self._call_one('get_many', list(keys), default)
+
+    def set_many(self, items):
+        """Sets more keys at once.
+
+        :param items: dict or list of (key, value) pairs
+        """
+        if isinstance(items, dict):
+            items = items.items()
+        self._call_one('set_many', [[key, value] for key, value in items])
+
+    def save_data(self):
+        """Saves data on server.
+        """
+        self._call_one('save')
+
+    def pipeline(self):
+        """Returns batch of requests which are sent at once.
+
+        :rtype: :py:class:`Pipeline`
+        """
+        return Pipeline(self)
+
+    def close(self):
+        """Closes unused connections.
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for connection in idle:
+            connection[1].close()
+            connection[0].close()
+
+
+class Pipeline:
+    """Batch of requests to :py:class:`KnowledgeServer` which are sent\
+    together by :py:meth:`execute`, so they wait for only one round trip.
+
+    Can be used as context manager which executes requests at the end.
+
+    :param client: client which sends requests
+    :type client: :py:class:`KnowledgeClient`
+    """
+    def __init__(self, client):
+        self.client = client
+        self.requests = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is None:
+            self.execute()
+
+    def get(self, key):
+        """Adds request for value of key.
+        """
+        self.requests.append(['get', key])
+        return self
+
+    def set(self, key, value):
+        """Adds request which sets key.
+        """
+        self.requests.append(['set', key, value])
+        return self
+
+    def delete(self, key):
+        """Adds request which deletes key.
+        """
+        self.requests.append(['delete', key])
+        return self
+
+    def execute(self):
+        """Sends all requests and returns list of their results; errors\
+        (like ``KeyError`` for missing key) are in list instead of results.
+        """
+        requests = self.requests
+        self.requests = []
+        self.results = self.client._call(requests) if requests else []
+        return self.results
+
+
+def _saved_size(value):
+    """Returns number of bytes of value in format version 2.*
+    """
+    out = bytearray()
+    _pack(value, out)
+    return len(out)
+
+
+def _v1_number(binary, start, stop):
+    """Returns number stored in binary[start:stop] in format version 1.*
+    """
+    view = memoryview(binary)
+    point = binary.find(2, start, stop)
+    if point < 0:
+        return sum(view[start:stop]) - 5 * (stop - start)
+    return sum(view[start:point]) - 5 * (point - start) +\
+      (sum(view[point + 1:stop]) - 5 * (stop - point - 1)) / 1000
+
+
+def _v1_values(chunks):
+    """Generator of data decoded from chunks of bytes in format version 1.*
+
+    Lists are built on a stack, so every byte is read only once regardless
+    of nesting and values may span chunk borders.
+    """
+    stack = []
+    thing = None
+    parts = []
+    for chunk in chunks:
+        if not hasattr(chunk, 'find'):
+            chunk = bytes(chunk)
+        view = memoryview(chunk)
+        pos = 0
+        end = len(chunk)
+        while pos < end:
+            if thing is None:
+                x = chunk[pos]
+                pos += 1
+                if x == 0:
+                    thing = 'integer'
+                elif x == 1:
+                    thing = 'string'
+                elif x == 3:
+                    stack.append([])
+                elif x == 4 and stack:
+                    value = stack.pop()
+                    if stack:
+                        stack[-1].append(value)
+                    else:
+                        yield value
+                continue
+            stop = chunk.find(0 if thing == 'integer' else 1, pos)
+            if stop < 0:
+                parts.append(bytes(view[pos:]))
+                break
+            if parts:
+                parts.append(view[pos:stop])
+                binary = b''.join(parts)
+                start, finish = 0, len(binary)
+                parts = []
+            else:
+                binary, start, finish = chunk, pos, stop
+            if thing == 'string':
+                value = str(memoryview(binary)[start:finish], 'latin-1')
+            else:
+                value = _v1_number(binary, start, finish)
+            thing = None
+            pos = stop + 1
+            if stack:
+                stack[-1].append(value)
+            else:
+                yield value
+
+
+def bytes_data(binary):
+    """Function that bytes converts to data(numbers, strings...).*
+    """
+    return _v1_values((binary,))
+
+
+def load(filename, ext='.knw', lazy=False, journal=False, workers=None,
+      track=False):
+    """Function that loads saved data and returns Knowledge object.
+
+    Both format versions are detected automatically.
+
+    :param str filename: name of data file without extension
+    :param str ext: extension of data file
+    :param bool lazy: if ``True`` and file has index of keys, file is\
+    memory-mapped and each value is decoded when it's first used
+    :param bool journal: turns on journal mode of returned object (see\
+    :py:class:`Knowledge`); later records of key override earlier ones
+    :param int workers: if given and file was saved in segments (see\
+    :py:meth:`Knowledge.save_data`), segments are decoded by that many\
+    processes
+    :param bool track: turns on tracking of changes of returned object (see\
+    :py:class:`Knowledge`), so saved form of loaded values which weren't\
+    got since is reused by :py:meth:`Knowledge.save_data`
+    :returns: data from file
+    :rtype: :py:class:`Knowledge`
+    """
+    with open(filename + ext, 'rb') as infile:
+        if lazy:
+            head = infile.read(len(MAGIC) + 3)
+            version, flags, pos = _read_header(head)
+            if flags & _INDEXED:
+                res = Knowledge(filename, ext, index=True, journal=journal)
+                res._buffer = mmap.mmap(infile.fileno(), 0,
+                  access=mmap.ACCESS_READ)
+                res._lazy, start, res._blocks = _read_index(res._buffer,
+                  flags & (_COMPRESSED | _CHECKED))
+                codec = 0
+                if flags & _COMPRESSED:
+                    codec = head[pos]
+                    res.compress = _CODECS[codec - 1]
+                    pos += 1
+                if flags & (_COMPRESSED | _CHECKED):
+                    res.checksum = bool(flags & _CHECKED)
+                    res._codec = _codec(codec)
+                    res._starts = [0]
+                    for block in res._blocks:
+                        res._starts.append(res._starts[-1] + block[2])
+                if flags & _INTERNED:
+                    res.intern = True
+                    res._table = _read_table(res._buffer, pos)[0]
+                res.track = track
+                res._unchanged = True
+                return res
+            infile.seek(0)
+        if workers:
+            head = infile.read(len(MAGIC) + 3 + _OFFSET.size)
+            version, flags, pos = _read_header(head)
+            if flags & _SEGMENTED:
+                res = Knowledge(filename, ext)
+                codec = 0
+                if flags & _COMPRESSED:
+                    codec = head[pos]
+                    pos += 1
+                    res.compress = _CODECS[codec - 1]
+                head = head[:pos + _OFFSET.size]
+                infile.seek(len(head))
+                head += infile.read(_OFFSET.unpack_from(head, pos)[0])
+                sizes, pos = _read_segments(head, pos)
+                starts = []
+                for size in sizes:
+                    starts.append(pos)
+                    pos += size
+                res.checksum = bool(flags & _CHECKED)
+                with ProcessPoolExecutor(workers) as pool:
+                    for records in pool.map(_decode_segment, repeat(
+                          filename + ext), starts, sizes, repeat(codec),
+                          repeat(res.checksum)):
+                        res.data.update(pickle.loads(records))
+                res.journal = journal
+                res.track = track
+                res._unchanged = True
+                return res
+            infile.seek(0)
+        a = bytearray(infile.read())
+    version, flags, pos = _read_header(a)
+    res = Knowledge(filename, ext)
+    if version > 1:
+        end = len(a)
+        codec = 0
+        if flags & _INDEXED:
+            res.index = True
+            end = _read_index(a)[1]
+        if flags & _COMPRESSED:
+            codec = a[pos]
+            pos += 1
+            res.compress = _CODECS[codec - 1]
+        res.checksum = bool(flags & _CHECKED)
+        table = None
+        # append to journal can be cut by crash, its records are ignored
+        torn = [] if flags & _JOURNAL else None
+        start = pos
+        try:
+            if flags & _SEGMENTED:
+                pos = _read_segments(a, pos)[1]
+            if flags & _INTERNED:
+                res.intern = True
+                table, pos = _read_table(a, pos)
+            for part, pos, stop in _body(a, pos, end, codec, res.checksum,
+                  torn):
+                while pos < stop:
+                    start = pos
+                    key, pos = _unpack(part, pos, table)
+                    value, pos = _unpack(part, pos, table)
+                    if value is DELETED:
+                        res.data.pop(key, None)
+                    else:
+                        res.data[key] = value
+        except (IndexError, struct.error):
+            if torn is None or res.checksum:
+                raise KnowledgeError(res.filename + ' is truncated')
+            torn.append(start)
+        if torn:
+            res._torn = torn[0]
+        res.journal = journal
+        res.track = track
+        res._appendable = journal and bool(flags & _JOURNAL)
+        res._unchanged = True
+        return res
+    res.journal = journal
+    state = 'key'
+    key = None
+    data = None
+    for x in bytes_data(a):
+        if state == 'key':
+            key = x
+            state = 'data'
+        else:
             data = x
             state = 'key'
             res[key] = data
             key = None
             data = None
+    res.track = track
+    res._unchanged = True
     return res
+
+
+def iter_load(filename, ext='.knw', chunk_size=65536):
+    """Generator of (key, value) pairs saved in file, reading it in chunks.
+
+    Only the part of file which isn't decoded yet is kept in memory, so
+    memory use depends on the biggest value, not on the file size. Journal
+    files give every record in order, deleted keys have value
+    :py:data:`DELETED`.
+
+    :param str filename: name of data file without extension
+    :param str ext: extension of data file
+    :param int chunk_size: number of bytes read at once
+    """
+    with open(filename + ext, 'rb') as infile:
+        head = infile.read(len(MAGIC) + 2)
+        version, flags, pos = _read_header(head)
+        if flags & _INDEXED:
+            infile.seek(-_OFFSET.size, 2)
+            left = _OFFSET.unpack(infile.read(_OFFSET.size))[0] - pos
+            infile.seek(pos)
+        else:
+            left = -1
+        if version == 1:
+            values = _v1_values(chain((head,), iter(partial(infile.read,
+              chunk_size), b'')))
+            for key in values:
+                for value in values:
+                    yield key, value
+                    break
+            return
+        module = _codec(0)
+        if flags & _COMPRESSED:
+            module = _codec(infile.read(1)[0])
+            left -= 1
+        frame = _CHECKED_BLOCK if flags & _CHECKED else _BLOCK
+        if flags & _SEGMENTED:
+            # segments follow each other, so they are read as one body
+            head = infile.read(_OFFSET.size)
+            infile.seek(_OFFSET.unpack(head)[0], 1)
+        table = None
+        if flags & _INTERNED:
+            head = infile.read(_OFFSET.size)
+            head += infile.read(_OFFSET.unpack(head)[0])
+            table = _read_table(head, 0)[0]
+            left -= len(head)
+        # append to journal can be cut by crash, its records are ignored
+        journal = flags & _JOURNAL
+        if flags & (_COMPRESSED | _CHECKED):
+            while left:
+                head = infile.read(frame.size)
+                if not head and left < 0:
+                    return
+                if len(head) < frame.size:
+                    if journal:
+                        return
+                    raise KnowledgeError(filename + ext + ' is truncated')
+                size = frame.unpack(head)[1]
+                left -= frame.size + size
+                block = infile.read(size)
+                if journal and (len(block) < size or zlib.crc32(block) !=
+                      frame.unpack(head)[2] and not infile.read(1)):
+                    return
+                if flags & _CHECKED:
+                    _check(block, frame.unpack(head)[2])
+                block = module.decompress(block)
+                pos = 0
+                while pos < len(block):
+                    key, pos = _unpack(block, pos, table)
+                    value, pos = _unpack(block, pos, table)
+                    yield key, value
+            return
+        buffer = bytearray()
+        pos = 0
+        while True:
+            try:
+                key, end = _unpack(buffer, pos, table)
+                value, end = _unpack(buffer, end, table)
+            except (IndexError, struct.error):
+                # new buffer, because decoded numpy arrays may use the old one
+                buffer = buffer[pos:]
+                pos = 0
+                # at least doubles the buffer, so big values aren't decoded
+                # again for every chunk
+                size = max(chunk_size, len(buffer))
+                chunk = infile.read(size if left < 0 else min(size, left))
+                left -= len(chunk)
+                if not chunk:
+                    if buffer and not journal:
+                        raise KnowledgeError(filename + ext + ' is truncated')
+                    return
+                buffer += chunk
+                continue
+            pos = end
+            yield key, value
+
+
+def _split(path):
+    """Returns file name without extension and extension of path.*
+    """
+    return os.path.splitext(path)
+
+
+def _settings(path):
+    """Returns version, flags and compression number of file.*
+    """
+    with open(path, 'rb') as infile:
+        head = infile.read(len(MAGIC) + 3)
+    version, flags, pos = _read_header(head)
+    return version, flags, head[pos] if flags & _COMPRESSED else 0
+
+
+def _type_name(value):
+    """Returns name of type of value for dump.*
+    """
+    if value is DELETED:
+        return 'deleted'
+    return type(value).__name__
+
+
+def _dump(args):
+    """Prints keys and types of values of file.*
+    """
+    for key, value in iter_load(*_split(args.file)):
+        line = repr(key) + '\t' + _type_name(value)
+        if isinstance(value, (str, list, dict, memoryview, array.array)):
+            line += '\t' + str(len(value))
+        print(line)
+    return 0
+
+
+def _convert(args):
+    """Writes file again with other format version or compression.*
+
+    Only keys are kept in memory: first pass finds last record of every key
+    (journal files can have more), second pass writes them. Format version
+    1 can't save every value (e.g. dicts, None and negative numbers), so
+    every record is decoded again and conversion fails if it changed.
+    """
+    source = _split(args.source)
+    last = {}
+    for number, (key, value) in enumerate(iter_load(*source)):
+        last[key] = number
+    compress = None if args.compress == 'none' else args.compress
+    codec = _CODECS.index(compress) + 1 if compress else 0
+    writer = None
+    if args.version > 1:
+        writer = _Writer(args.index, codec, args.intern, args.checksum)
+    elif compress or args.index or args.intern or args.checksum:
+        print('format version 1 has no options', file=sys.stderr)
+        return 2
+
+    def records():
+        for number, (key, value) in enumerate(iter_load(*source)):
+            if last[key] == number and value is not DELETED:
+                yield key, value
+    if writer is not None and writer.counts is not None:
+        for key, value in records():
+            writer.count(key, value)
+    with open(args.target + '.tmp', 'wb') as output:
+        for key, value in records():
+            if writer is None:
+                try:
+                    binary = data_bytes(key) + data_bytes(value)
+                    same = list(bytes_data(binary)) == [key, value]
+                except (ValueError, TypeError, IndexError):
+                    same = False
+                if not same:
+                    output.close()
+                    os.remove(args.target + '.tmp')
+                    print('format version 1 can\'t save record of key ' +
+                      repr(key), file=sys.stderr)
+                    return 1
+                output.write(binary)
+            else:
+                writer.add(key, value)
+                output.write(writer.take())
+        if writer is not None:
+            writer.finish()
+            output.write(writer.take())
+        _sync(output)
+    os.replace(args.target + '.tmp', args.target)
+    return 0
+
+
+def _verify(args):
+    """Decodes whole file, checks its checksums and index.*
+    """
+    name, ext = _split(args.file)
+    version, flags, codec = _settings(args.file)
+    try:
+        count = 0
+        for record in iter_load(name, ext):
+            count += 1
+        if flags & _INDEXED:
+            res = load(name, ext, lazy=True)
+            for key in res._lazy:
+                res._decode(res._lazy[key])
+            res.load_all()
+    except (KnowledgeError, IndexError, struct.error, UnicodeError,
+          ValueError) as error:
+        print(args.file + ': damaged (' + str(error) + ')')
+        return 1
+    print(args.file + ': ok, ' + str(count) + ' records, ' +
+      ('checksums verified' if flags & _CHECKED else 'no checksums'))
+    return 0
+
+
+def _bench(args):
+    """Prints encoding and decoding speed of file.*
+    """
+    name, ext = _split(args.file)
+    size = os.path.getsize(args.file)
+    version, flags, codec = _settings(args.file)
+    decode = encode = float('inf')
+    for x in range(args.repeat):
+        start = perf_counter()
+        for record in iter_load(name, ext):
+            pass
+        decode = min(decode, perf_counter() - start)
+        start = perf_counter()
+        if version > 1:
+            writer = _Writer(flags & _INDEXED, codec, False, flags & _CHECKED)
+            for key, value in iter_load(name, ext):
+                writer.add(key, value)
+                writer.take()
+            writer.finish()
+        else:
+            for key, value in iter_load(name, ext):
+                data_bytes(key)
+                data_bytes(value)
+        encode = min(encode, perf_counter() - start - decode)
+    megabytes = size / 1e6
+    print('decode: %.1f MB/s (%.3f s)' % (megabytes / decode, decode))
+    print('encode: %.1f MB/s (%.3f s)' % (megabytes / max(encode, 1e-9),
+      encode))
+    return 0
+
+
+def main(argv=None):
+    """Command-line tool for Knowledge files (``python -m Mind.Knowledge``).
+
+    Commands are ``dump`` (keys and types of values), ``convert`` (other
+    format version or compression), ``verify`` (checksums and index) and
+    ``bench`` (encoding and decoding speed). Files are read in chunks, so
+    memory use doesn't depend on their size.
+
+    :param list argv: arguments (``sys.argv[1:]`` if ``None``)
+    :returns: exit status
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(prog='python -m Mind.Knowledge',
+      description='Tool for Knowledge files.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    command = commands.add_parser('dump', help='print keys and types')
+    command.add_argument('file')
+    command.set_defaults(run=_dump)
+    command = commands.add_parser('convert', help='save file again with'
+      ' other options')
+    command.add_argument('source')
+    command.add_argument('target')
+    command.add_argument('--version', type=int, choices=(1, 2),
+      default=VERSION)
+    command.add_argument('--compress', choices=_CODECS + ('none',),
+      default='none')
+    command.add_argument('--index', action='store_true')
+    command.add_argument('--intern', action='store_true')
+    command.add_argument('--checksum', action='store_true')
+    command.set_defaults(run=_convert)
+    command = commands.add_parser('verify', help='check whole file')
+    command.add_argument('file')
+    command.set_defaults(run=_verify)
+    command = commands.add_parser('bench', help='measure speed')
+    command.add_argument('file')
+    command.add_argument('--repeat', type=int, default=3)
+    command.set_defaults(run=_bench)
+    args = parser.parse_args(argv)
+    try:
+        return args.run(args)
+    except (OSError, KnowledgeError) as error:
+        print(str(error), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,43 @@ from xml.etree.ElementTree import ElementTree as Tree
 import base64 as b64
 import zlib
 import math
+import array
+from itertools import chain
 from os import path
 
 import pygame
 
+try:
+    from . import Knowledge
+except ImportError:
+    import Knowledge  # imported outside of package (e.g. by Test.py)
+
+SNAPSHOT_VERSION = 1
+"""Version of data saved by :py:meth:`visual_map.snapshot`.
+"""
+_TILE_CODES = ('B', 'H', 'I', 'Q')
+
+
+def _pack_mapping(mapping):
+    """Returns layer mapping (rows of tile numbers) as list of width and flat\
+    array with the smallest typecode.*
+    """
+    width = len(mapping[0]) if mapping else 0
+    if any(len(row) != width for row in mapping):
+        raise ValueError("rows of layer mapping don't have the same length")
+    high = max(map(max, mapping)) if width else 0
+    for code in _TILE_CODES:
+        if high < 1 << array.array(code).itemsize * 8:
+            break
+    return [width, array.array(code, chain.from_iterable(mapping))]
+
+
+def _unpack_mapping(width, tiles):
+    """Returns layer mapping (rows of tile numbers) from flat array.*
+    """
+    tiles = tiles.tolist()
+    return [tiles[x:x + width] for x in range(0, len(tiles), width or 1)]
+
 
 class MapError(Exception):
     """Exception for points outside the map.*
@@ -29,13 +62,331 @@ class MapError(Exception):
         return self.fin
 
 
+class SpatialGrid:
+    """Uniform grid of square cells (spatial hash) which :py:class:`MAP`\
+    uses to find objects by position.
+
+    Every object is in all cells which its box touches, so finding objects
+    at some point checks only objects in one cell.
+
+    :param cell_size: width and height of one cell
+    """
+    def __init__(self, cell_size=64):
+        if cell_size <= 0:
+            raise ValueError('cell_size should be positive')
+        self.cell_size = cell_size
+        self.cells = {}
+        self.ranges = {}
+
+    def _range(self, box):
+        """Returns first and last column and row of cells under box.*
+        """
+        size = self.cell_size
+        return (int(box[0] // size), int(box[1] // size), int(box[2] //
+          size), int(box[3] // size))
+
+    def add(self, obj, box):
+        """Adds object with given box (left, top, right, bottom).
+        """
+        cells = self._range(box)
+        self.ranges[id(obj)] = cells
+        for x in range(cells[0], cells[2] + 1):
+            for y in range(cells[1], cells[3] + 1):
+                self.cells.setdefault((x, y), {})[id(obj)] = obj
+
+    def remove(self, obj):
+        """Removes object (nothing happens if it isn't in grid).
+        """
+        cells = self.ranges.pop(id(obj), None)
+        if cells is None:
+            return
+        for x in range(cells[0], cells[2] + 1):
+            for y in range(cells[1], cells[3] + 1):
+                cell = self.cells[x, y]
+                del cell[id(obj)]
+                if not cell:
+                    del self.cells[x, y]
+
+    def move(self, obj, box):
+        """Changes box of object; it's cheap if object stays in the same\
+        cells.
+        """
+        if self.ranges.get(id(obj)) != self._range(box):
+            self.remove(obj)
+            self.add(obj, box)
+
+    def query(self, left, top, right, bottom):
+        """Returns objects in cells which box touches (some of them may be\
+        outside of box).
+        """
+        first_x, first_y, last_x, last_y = self._range((left, top, right,
+          bottom))
+        found = {}
+        if (last_x - first_x + 1) * (last_y - first_y + 1) > len(
+              self.cells):
+            for (x, y), cell in self.cells.items():
+                if first_x <= x <= last_x and first_y <= y <= last_y:
+                    found.update(cell)
+        else:
+            for x in range(first_x, last_x + 1):
+                for y in range(first_y, last_y + 1):
+                    cell = self.cells.get((x, y))
+                    if cell:
+                        found.update(cell)
+        return found.values()
+
+
+def _union(a, b):
+    """Returns the smallest box which contains boxes a and b.*
+    """
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3],
+      b[3]))
+
+
+def _perimeter(box):
+    """Returns half of box perimeter (cost of box in tree).*
+    """
+    return box[2] - box[0] + box[3] - box[1]
+
+
+class _Node:
+    """Node of :py:class:`AABBTree`; leaves have object and no children.*
+    """
+    __slots__ = ('box', 'parent', 'left', 'right', 'obj', 'height')
+
+    def __init__(self, box, parent=None, obj=None):
+        self.box = box
+        self.parent = parent
+        self.left = self.right = None
+        self.obj = obj
+        self.height = 0
+
+
+class AABBTree:
+    """Dynamic tree of axis-aligned boxes which :py:class:`MAP` can use\
+    instead of :py:class:`SpatialGrid`.
+
+    Leaves keep boxes of objects enlarged by margin on every side, so
+    objects which move a bit (e.g. by ``map_obj.move`` every frame) stay in
+    their leaves and tree isn't changed. Other objects are removed and
+    inserted again, next to the leaf which enlarges tree the least. Tree is
+    balanced by rotations (like AVL tree), so it's good for maps with
+    objects of very different sizes or very uneven density.
+
+    :param margin: how much boxes of leaves are bigger than boxes of objects
+    """
+    def __init__(self, margin=8):
+        if margin < 0:
+            raise ValueError("margin can't be negative")
+        self.margin = margin
+        self.root = None
+        self.leaves = {}
+
+    def _fat(self, box):
+        """Returns box enlarged by margin.*
+        """
+        return (box[0] - self.margin, box[1] - self.margin, box[2] +
+          self.margin, box[3] + self.margin)
+
+    def _replace(self, old, new):
+        """Puts node new on the place of node old in its parent.*
+        """
+        parent = new.parent = old.parent
+        if parent is None:
+            self.root = new
+        elif parent.left is old:
+            parent.left = new
+        else:
+            parent.right = new
+
+    def _insert(self, leaf):
+        """Inserts leaf to tree.*
+        """
+        if self.root is None:
+            self.root = leaf
+            leaf.parent = None
+            return
+        box = leaf.box
+        node = self.root
+        while node.left is not None:
+            area = _perimeter(_union(node.box, box))
+            cost = 2 * area
+            inherited = 2 * (area - _perimeter(node.box))
+            costs = []
+            for child in (node.left, node.right):
+                child_cost = _perimeter(_union(child.box, box)) + inherited
+                if child.left is not None:
+                    child_cost -= _perimeter(child.box)
+                costs.append(child_cost)
+            if cost < costs[0] and cost < costs[1]:
+                break
+            node = node.left if costs[0] < costs[1] else node.right
+        parent = _Node(_union(node.box, box))
+        self._replace(node, parent)
+        parent.left = node
+        parent.right = leaf
+        node.parent = leaf.parent = parent
+        self._refit(parent)
+
+    def _remove(self, leaf):
+        """Removes leaf from tree.*
+        """
+        parent = leaf.parent
+        if parent is None:
+            self.root = None
+            return
+        sibling = parent.right if parent.left is leaf else parent.left
+        self._replace(parent, sibling)
+        if sibling.parent is not None:
+            self._refit(sibling.parent)
+
+    def _refit(self, node):
+        """Balances node and its ancestors and updates their boxes and\
+        heights.*
+        """
+        while node is not None:
+            node = self._balance(node)
+            node.height = 1 + max(node.left.height, node.right.height)
+            node.box = _union(node.left.box, node.right.box)
+            node = node.parent
+
+    def _balance(self, a):
+        """Rotates subtree a if one of its children is higher by more than\
+        one; returns new root of subtree.*
+        """
+        if a.left is None or a.height < 2:
+            return a
+        b, c = a.left, a.right
+        balance = c.height - b.height
+        if balance > 1:
+            high, low = c, b
+        elif balance < -1:
+            high, low = b, c
+        else:
+            return a
+        f, g = high.left, high.right
+        if f.height < g.height:
+            f, g = g, f
+        # high takes place of a; a keeps low and the lower child of high
+        self._replace(a, high)
+        high.left = a
+        high.right = f
+        a.parent = high
+        if a.left is high:
+            a.left = g
+        else:
+            a.right = g
+        g.parent = a
+        a.box = _union(low.box, g.box)
+        a.height = 1 + max(low.height, g.height)
+        high.box = _union(a.box, f.box)
+        high.height = 1 + max(a.height, f.height)
+        return high
+
+    def add(self, obj, box):
+        """Adds object with given box (left, top, right, bottom).
+        """
+        leaf = _Node(self._fat(box), obj=obj)
+        self.leaves[id(obj)] = leaf
+        self._insert(leaf)
+
+    def remove(self, obj):
+        """Removes object (nothing happens if it isn't in tree).
+        """
+        leaf = self.leaves.pop(id(obj), None)
+        if leaf is not None:
+            self._remove(leaf)
+
+    def move(self, obj, box):
+        """Changes box of object; it's cheap if new box is in box of its\
+        leaf.
+        """
+        leaf = self.leaves.get(id(obj))
+        if leaf is None:
+            self.add(obj, box)
+            return
+        fat = leaf.box
+        if fat[0] <= box[0] and fat[1] <= box[1] and box[2] <= fat[2] and\
+          box[3] <= fat[3]:
+            return
+        self._remove(leaf)
+        leaf.box = self._fat(box)
+        self._insert(leaf)
+
+    def query(self, left, top, right, bottom):
+        """Returns objects whose leaves overlap box (some of them may be\
+        outside of box).
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            box = node.box
+            if box[0] <= right and left <= box[2] and box[1] <= bottom and\
+              top <= box[3]:
+                if node.left is None:
+                    found.append(node.obj)
+                else:
+                    stack.append(node.left)
+                    stack.append(node.right)
+        return found
+
+
+def _bounds(obj):
+    """Returns box (left, top, right, bottom) of object or ``None`` if it\
+    can't be found by position.*
+    """
+    kind = type(obj)
+    if kind == point:
+        return (obj.x, obj.y, obj.x, obj.y)
+    elif kind == rect:
+        return (obj.x, obj.y, obj.x + obj.width, obj.y + obj.height)
+    elif kind == group_of_points:
+        if not obj.points:
+            return None
+        xs = [p.x for p in obj.points]
+        ys = [p.y for p in obj.points]
+        return (min(xs), min(ys), max(xs), max(ys))
+    elif isinstance(obj, Object):
+        box = _bounds(obj.obj)
+        if box and isinstance(obj, map_obj) and hasattr(obj, 'x'):
+            return (obj.x, obj.y, obj.x + box[2] - box[0], obj.y + box[3] -
+              box[1])
+        return box
+    return None
+
+
 class MAP:
     """Basic map class.
+
+    Objects are kept in index (:py:class:`SpatialGrid` or
+    :py:class:`AABBTree`), so ``at`` and ``query_rect`` check only objects
+    near given position. ``at`` finds points, groups of points and rects,
+    ``query_rect`` finds tilemap objects (:py:class:`Object`) too. Positions
+    of objects are read when they are added; after changing them directly
+    (e.g. ``rect.x = 10``) call ``update``. :py:class:`map_obj` and
+    :py:class:`direction` do it when they move.
+
+    :param int width: width of map
+    :param int height: height of map
+    :param cell_size: size of cells of grid index
+    :param index: ``'grid'`` (:py:class:`SpatialGrid`), ``'tree'``\
+    (:py:class:`AABBTree`; better for many moving objects of different\
+    sizes) or instance of index class
     """
-    def __init__(self, width, height):
+    def __init__(self, width, height, cell_size=64, index='grid'):
         self.width = width
         self.height = height
         self.objects = []
+        self.numbers = {}
+        if index == 'grid':
+            self.index = SpatialGrid(cell_size)
+        elif index == 'tree':
+            self.index = AABBTree()
+        elif isinstance(index, str):
+            raise ValueError('unknown index ' + repr(index))
+        else:
+            self.index = index
 
     def __repr__(self):
         if self.objects:
@@ -64,28 +415,66 @@ class MAP:
         if type(self.obj) == point:
             if self.obj.x > self.width or self.obj.y > self.height:
                 raise MapError(obj.x, obj.y, self.width, self.height)
+        self.numbers[id(self.obj)] = len(self.objects)
         self.objects.append(self.obj)
+        box = _bounds(self.obj)
+        if box:
+            self.index.add(self.obj, box)
+
+    def update(self, obj):
+        """Updates index after object's position or size was changed\
+        (nothing happens if object isn't in map).
+        """
+        if id(obj) not in self.numbers:
+            return
+        box = _bounds(obj)
+        if box:
+            self.index.move(obj, box)
+        else:
+            self.index.remove(obj)
+
+    def _near(self, left, top, right, bottom):
+        """Returns objects from index near box in order of adding.*
+        """
+        return sorted(self.index.query(left, top, right, bottom), key=lambda
+          obj: self.numbers[id(obj)])
 
     def at(self, x, y):
         """Return generator of all items in map on x, y coordinates.
         """
-        self.x = x
-        self.y = y
-        for obj in self.objects:
+        for obj in self._near(x, y, x, y):
             if type(obj) == point:
-                if obj.x == self.x and obj.y == self.y:
+                if obj.x == x and obj.y == y:
                     yield obj
             elif type(obj) == group_of_points:
-                self.T = False
-                for POINT in obj.at(self.x, self.y):
+                T = False
+                for POINT in obj.at(x, y):
                     yield POINT
-                    self.T = True
-                if self.T:
+                    T = True
+                if T:
                     yield obj
             elif type(obj) == rect:
-                if obj.at(self.x, self.y):
+                if obj.at(x, y):
                     yield obj
 
+    def query_rect(self, x, y, width, height):
+        """Return list of all items in map whose box overlaps given rect.
+
+        :param x: left side of rect
+        :param y: top side of rect
+        :param width: width of rect
+        :param height: height of rect
+        """
+        right = x + width
+        bottom = y + height
+        fin = []
+        for obj in self._near(x, y, right, bottom):
+            box = _bounds(obj)
+            if box and box[0] <= right and x <= box[2] and box[1] <= bottom\
+              and y <= box[3]:
+                fin.append(obj)
+        return fin
+
 
 class point:
     """Basic point class.
@@ -387,6 +776,7 @@ class direction:
         """'Moves' directions point.
         """
         self.point.x, self.point.y = self.get_pos(distance).get_xy()
+        self.Map.update(self.point)
 
     def set_angle(self, angle):
         """Sets new angle.
@@ -726,6 +1116,7 @@ class map_obj(Object):
         super().__init__(name, Type, props, Map, obj)
         self.picture = picture
         self.x, self.y = self.obj.get_xy()
+        self.Map.in_map.update(self)
 
     @classmethod
     def __tmx_init__(cls, obj, Map):
@@ -750,12 +1141,14 @@ class map_obj(Object):
         """
         self.x = x
         self.y = y
+        self.Map.in_map.update(self)
 
     def move(self, x, y):
         """Moves object.
         """
         self.x += x
         self.y += y
+        self.Map.in_map.update(self)
 
 
 class Subject(map_obj):
@@ -863,10 +1256,14 @@ class visual_map:
     :param bool gid_line: if ``True`` object's obj will be line if rect\
     doesn't have width **or** height
     :param bool size_in_tiles: is ``x`` and ``y`` measured in tiles
+    :param cell_size: size of cells of ``in_map`` grid index
+    :param index: ``in_map`` index (``'grid'``, ``'tree'`` or instance of\
+    index class, see :py:class:`MAP`)
     """
     def __init__(self, x, y, layers=True, path="", decode=[{}, {}, {}],
           tilesize=(), images={}, else_=[layer, objectgroup, Object],
-          gid_point=True, gid_line=True, size_in_tiles=False):
+          gid_point=True, gid_line=True, size_in_tiles=False, cell_size=64,
+          index='grid'):
         self.path = path
         
         self.screen = pygame.display.get_surface()
@@ -902,7 +1299,7 @@ class visual_map:
 
         self.objects = []
         self.objectgroups = []
-        self.in_map = MAP(self.width, self.height)
+        self.in_map = MAP(self.width, self.height, cell_size, index)
         self.gid_point = gid_point
         self.gid_line = gid_line
 
@@ -1083,6 +1480,72 @@ class visual_map:
         self.edge_x = x
         self.edge_y = y
 
+    def snapshot(self):
+        """Returns state of map (tiles of layers, positions and properties\
+        of objects, camera and objects of objectgroups) as bytes.
+
+        Tiles are saved as packed arrays so quick-save of big maps is fast.
+        Objects are saved in order of ``objects``, so blob can be restored
+        only into map with the same objects (e.g. the same map loaded again).
+        """
+        return zlib.compress(Knowledge.data_bytes_v2(self._get_state()), 1)
+
+    def restore(self, blob):
+        """Restores state of map saved by :py:meth:`snapshot`.
+
+        :param bytes blob: saved state
+        :raises ValueError: if blob doesn't belong to this map
+        """
+        self._set_state(next(Knowledge.bytes_data_v2(zlib.decompress(blob))))
+
+    def _get_state(self):
+        """Returns dict with state of map.*
+        """
+        numbers = {id(obj): n for n, obj in enumerate(self.objects)}
+        groups = []
+        for group in self.objectgroups:
+            try:
+                groups.append([numbers[id(obj)] for obj in group.objects])
+            except KeyError:
+                raise ValueError("objectgroup " + repr(group.name) + " has"
+                  " object which isn't in map") from None
+        objects = []
+        for obj in self.objects:
+            if isinstance(obj, map_obj):
+                objects.append([obj.x, obj.y, obj.props])
+            else:
+                objects.append([None, None, obj.props])
+        return {
+            'version': SNAPSHOT_VERSION,
+            'layers': [_pack_mapping(l.mapping) for l in self.layers or ()],
+            'objects': objects,
+            'groups': groups,
+            'camera': [self.x, self.y],
+        }
+
+    def _set_state(self, state):
+        """Sets state of map from dict.*
+        """
+        if state.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('unknown snapshot version ' +
+              repr(state.get('version')))
+        layers = self.layers or ()
+        if len(state['layers']) != len(layers) or len(state['objects']) !=\
+          len(self.objects) or len(state['groups']) != len(
+          self.objectgroups):
+            raise ValueError("snapshot doesn't belong to this map")
+        for l, (width, tiles) in zip(layers, state['layers']):
+            l.mapping = _unpack_mapping(width, tiles)
+        for obj, (x, y, props) in zip(self.objects, state['objects']):
+            obj.props = props
+            if x is not None:
+                map_obj.set_position(obj, x, y)
+        for group, numbers in zip(self.objectgroups, state['groups']):
+            group.objects = [self.objects[n] for n in numbers]
+        self.x, self.y = state['camera']
+        for l in layers:
+            l.set_pos(self.x, self.y)
+
 
 class tiled_map(visual_map):
     """Basic class for map in Tiled.
@@ -1097,9 +1560,13 @@ class tiled_map(visual_map):
     doesn't have width **and** height
     :param bool gid_line: if ``True`` object's obj will be line if rect\
     doesn't have width **or** height
+    :param cell_size: size of cells of ``in_map`` grid index
+    :param index: ``in_map`` index (``'grid'``, ``'tree'`` or instance of\
+    index class, see :py:class:`MAP`)
     """
     def __init__(self, name, decode=[{}, {}, {}], else_=[layer,
-          objectgroup, Object], gid_point=True, gid_line=True):
+          objectgroup, Object], gid_point=True, gid_line=True, cell_size=64,
+          index='grid'):
         self.name = name + '.tmx'
         self.xml = Tree(file=self.name)
         self.out_map = self.xml.getroot()
@@ -1107,7 +1574,7 @@ class tiled_map(visual_map):
           int(self.out_map.attrib["height"]), True, path.dirname(self.name),
           decode, (int(self.out_map.attrib["tilewidth"]),
           int(self.out_map.attrib["tileheight"])), {}, else_, gid_point,
-          gid_line, True)
+          gid_line, True, cell_size, index)
 
         for part in self.out_map:
             if part.tag == "tileset":
@@ -1147,10 +1614,15 @@ class moving_map(tiled_map):
     doesn't have width **and** height
     :param bool gid_line: if ``True`` object's obj will be line if rect\
     doesn't have width **or** height
+    :param cell_size: size of cells of ``in_map`` grid index
+    :param index: ``in_map`` index (``'grid'``, ``'tree'`` or instance of\
+    index class, see :py:class:`MAP`)
     """
     def __init__(self, name, x, y, decode=[{}, {}, {}], else_=[layer,
-          objectgroup, Object], gid_point=True, gid_line=True):
-        super().__init__(name, decode, else_, gid_point, gid_line)
+          objectgroup, Object], gid_point=True, gid_line=True, cell_size=64,
+          index='grid'):
+        super().__init__(name, decode, else_, gid_point, gid_line,
+          cell_size, index)
         self.X = x
         self.Y = y
         self.set_camera_pos(self.X, self.Y)
@@ -1188,3 +1660,16 @@ class moving_map(tiled_map):
         self.X += hor
         self.Y += ver
         self.set_camera_pos(self.X, self.Y, pos, edge)
+
+    def _get_state(self):
+        """Returns dict with state of map and its centre object.*
+        """
+        state = super()._get_state()
+        state['centre'] = [self.X, self.Y]
+        return state
+
+    def _set_state(self, state):
+        """Sets state of map and its centre object from dict.*
+        """
+        super()._set_state(state)
+        self.X, self.Y = state['centre']
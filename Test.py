@@ -46,6 +46,42 @@ def test_load():
     print(load)
 
 
+def test_intern():
+    """
+    This test Mind.Knowledge.Knowledge with intern
+    (lists which are equal, but saved differently, aren't merged).
+    """
+    save = Knowledge.Knowledge('test_intern', intern=True)
+    save['a'] = [0.0]
+    save['b'] = [-0.0]
+    save['c'] = [[1], 'x']
+    save['d'] = [[1.0], 'x']
+    save['e'] = [1, 'x']
+    save['f'] = [True, 'x']
+    save['g'] = [1, 'x']
+    save.save_data()
+    load = Knowledge.load('test_intern')
+    assert load.data == save.data
+    for key in save:
+        assert list(map(type, load[key])) == list(map(type, save[key]))
+    assert str(load['b'][0]) == '-0.0'
+    assert type(load['d'][0][0]) is float
+
+
+def test_segments():
+    """
+    This test Mind.Knowledge.Knowledge.save_data with workers
+    (also for loaded bytes, which are memoryviews).
+    """
+    save = Knowledge.Knowledge('test_segments')
+    for x in range(1000):
+        save[x] = [x, 'value', b'blob']
+    save.save_data(workers=2)
+    load = Knowledge.load('test_segments')
+    load.save_data(workers=2)
+    assert Knowledge.load('test_segments', workers=2).data == save.data
+
+
 def test_map():
     """
     This test Mind.Orientation.MAP